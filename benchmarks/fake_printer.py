@@ -0,0 +1,262 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import argparse
+import datetime
+import http.server
+import ssl
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from escpr2_tools.ipp import (
+    IPP_STATUS_SUCCESSFUL_OK,
+    IPP_TAG_CHARSET,
+    IPP_TAG_NATURAL_LANGUAGE,
+    IPP_TAG_OPERATION_ATTRIBUTES,
+    IPP_VERSION_2_0,
+    IppAttribute,
+    IppAttributeGroup,
+    IppParseError,
+    encode_ipp_message,
+    parse_ipp_message,
+)
+
+READ_SIZE: int = 64 * 1024
+# Only the start of a body is kept to parse the IPP request from
+MAX_HEADER_SIZE: int = 64 * 1024
+
+
+class ReceivedJob(NamedTuple):
+    operation_id: int | None
+    body_bytes: int
+    # From the request line until the body has been consumed
+    seconds: float
+
+
+def write_self_signed_certificate(directory: Path) -> tuple[Path, Path]:
+    # cryptography is installed along with mitmproxy
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "escpr2 fake printer")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .sign(key, hashes.SHA256())
+    )
+
+    certfile = directory / "fake-printer.pem"
+    keyfile = directory / "fake-printer.key"
+    certfile.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    keyfile.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return certfile, keyfile
+
+
+class IppRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakePrinterServer"
+
+    def do_POST(self):
+        start = time.perf_counter()
+        header = bytearray()
+        body_bytes = 0
+        for chunk in self.__iter_body():
+            body_bytes += len(chunk)
+            if len(header) < MAX_HEADER_SIZE:
+                header += chunk[: MAX_HEADER_SIZE - len(header)]
+
+        try:
+            message = parse_ipp_message(header)
+        except IppParseError:
+            message = None
+        self.server.record(
+            ReceivedJob(
+                message.operation_id if message is not None else None,
+                body_bytes,
+                time.perf_counter() - start,
+            )
+        )
+
+        response = encode_ipp_message(
+            IPP_VERSION_2_0,
+            IPP_STATUS_SUCCESSFUL_OK,
+            message.request_id if message is not None else 0,
+            [
+                IppAttributeGroup(
+                    IPP_TAG_OPERATION_ATTRIBUTES,
+                    [
+                        IppAttribute("attributes-charset", IPP_TAG_CHARSET, [b"utf-8"]),
+                        IppAttribute(
+                            "attributes-natural-language",
+                            IPP_TAG_NATURAL_LANGUAGE,
+                            [b"en"],
+                        ),
+                    ],
+                )
+            ],
+        )
+        self.send_response(200)
+        self.send_header("content-type", "application/ipp")
+        self.send_header("content-length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+    def __iter_body(self):
+        if self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while (size := int(self.rfile.readline().split(b";")[0], 16)) > 0:
+                while size > 0:
+                    chunk = self.rfile.read(min(size, READ_SIZE))
+                    if not chunk:
+                        raise ConnectionError("Connection closed in chunk")
+                    size -= len(chunk)
+                    yield chunk
+                self.rfile.readline()
+            # Trailers
+            while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            return
+
+        remaining = int(self.headers.get("content-length", 0))
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, READ_SIZE))
+            if not chunk:
+                raise ConnectionError("Connection closed in body")
+            remaining -= len(chunk)
+            yield chunk
+
+
+class FakePrinterServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], context: ssl.SSLContext) -> None:
+        super().__init__(address, IppRequestHandler)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.__lock: threading.Lock = threading.Lock()
+        self.__jobs: list[ReceivedJob] = []
+
+    def record(self, job: ReceivedJob):
+        with self.__lock:
+            self.__jobs.append(job)
+
+    def get_jobs(self) -> list[ReceivedJob]:
+        with self.__lock:
+            return list(self.__jobs)
+
+
+class FakePrinter:
+    # HTTPS IPP server that consumes every request and answers successful-ok,
+    # a stand-in for the printer behind escpr2-proxy
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        certfile: Path | None = None,
+        keyfile: Path | None = None,
+    ) -> None:
+        self.__certificate_dir: tempfile.TemporaryDirectory | None = None
+        if certfile is None:
+            self.__certificate_dir = tempfile.TemporaryDirectory()
+            certfile, keyfile = write_self_signed_certificate(
+                Path(self.__certificate_dir.name)
+            )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self.server: FakePrinterServer = FakePrinterServer((host, port), context)
+        self.__thread: threading.Thread | None = None
+
+    def get_address(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def get_jobs(self) -> list[ReceivedJob]:
+        return self.server.get_jobs()
+
+    def start(self):
+        self.__thread = threading.Thread(
+            target=self.server.serve_forever, name="fake-printer", daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is not None:
+            self.server.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.server.server_close()
+        if self.__certificate_dir is not None:
+            self.__certificate_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.fake_printer",
+        description="Serve a fake IPP printer over HTTPS that accepts every job.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8631)
+    parser.add_argument(
+        "--certfile", help="PEM certificate, a self-signed one is created by default"
+    )
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    printer = FakePrinter(
+        args.host,
+        args.port,
+        Path(args.certfile) if args.certfile else None,
+        Path(args.keyfile) if args.keyfile else None,
+    )
+    print(f"Fake printer listening on {printer.get_address()}")
+    try:
+        printer.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        printer.stop()
+        for job in printer.get_jobs():
+            print(
+                f"operation {job.operation_id}: {job.body_bytes} bytes "
+                f"in {job.seconds:.3f} s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any
+
+from benchmarks.run import get_commit
+
+# Modules behind the CLI entry points and what they must not pull in
+ENTRY_POINT_MODULES: dict[str, tuple[str, ...]] = {
+    "escpr2_tools.decode_escpr": ("mitmproxy", "unittest", "numpy", "multiprocessing"),
+    "escpr2_tools.config": ("mitmproxy", "unittest", "numpy"),
+    "escpr2_tools.capture": ("mitmproxy", "unittest", "numpy"),
+    "escpr2_tools.proxy": ("unittest", "numpy"),
+}
+
+
+def import_module(module: str) -> tuple[int, set[str]]:
+    # Cumulative import time in microseconds and all modules imported, in a
+    # fresh interpreter
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    cumulative: int | None = None
+    imported: set[str] = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        if not cumulative_us.strip().isdigit():
+            # Column headers
+            continue
+        imported.add(name.strip())
+        if name.strip() == module:
+            cumulative = int(cumulative_us)
+    if cumulative is None:
+        raise RuntimeError(f"{module} was not imported")
+    return cumulative, imported
+
+
+def measure_imports(repeat: int) -> dict[str, dict[str, Any]]:
+    results: dict[str, dict[str, Any]] = {}
+    for module, forbidden in ENTRY_POINT_MODULES.items():
+        timings: list[int] = []
+        imported: set[str] = set()
+        for _ in range(repeat):
+            cumulative, imported = import_module(module)
+            timings.append(cumulative)
+        results[module] = {
+            "min_us": min(timings),
+            "median_us": statistics.median(timings),
+            "modules": len(imported),
+            # A submodule is never imported without its top level package
+            "forbidden_imports": sorted(imported & set(forbidden)),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.import_time",
+        description="Measure the import time of the CLI modules with -X importtime.",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        help="Exit with an error if any module except escpr2_tools.proxy takes "
+        "longer than this (best of --repeat)",
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = measure_imports(args.repeat)
+    output = json.dumps(
+        {
+            "commit": get_commit(),
+            "timestamp": time.time(),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "parameters": {"repeat": args.repeat},
+            "results": results,
+        },
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+    failed = [
+        module
+        for module, result in results.items()
+        if result["forbidden_imports"]
+        or (
+            args.max_ms is not None
+            and module != "escpr2_tools.proxy"
+            and result["min_us"] > args.max_ms * 1000
+        )
+    ]
+    if failed:
+        print(f"Import regression in {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
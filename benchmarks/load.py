@@ -0,0 +1,299 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import signal
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+from benchmarks.fake_printer import FakePrinter
+from benchmarks.run import get_commit
+from benchmarks.synthetic import make_send_document
+from escpr2_tools.ipp import parse_ipp_message
+
+PROXY_START_TIMEOUT: float = 30.0
+RSS_SAMPLE_INTERVAL: float = 0.05
+# Between the chunks of a split body, so that the proxy reads them separately
+SPLIT_PAUSE: float = 0.1
+
+
+def get_rss(pid: int) -> int | None:
+    # Resident set size in bytes, Linux only
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    def __init__(self, pid: int) -> None:
+        self.pid: int = pid
+        self.peak: int | None = None
+        self.__stop: threading.Event = threading.Event()
+        self.__thread: threading.Thread = threading.Thread(
+            target=self.__sample, name="rss", daemon=True
+        )
+
+    def __enter__(self) -> "RssSampler":
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.__stop.set()
+        self.__thread.join()
+
+    def __sample(self):
+        while True:
+            rss = get_rss(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            if self.__stop.wait(RSS_SAMPLE_INTERVAL):
+                return
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    # Nearest rank
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def start_proxy(
+    printer_address: str, local_port: int, config_path: Path, proxy_args: list[str]
+) -> subprocess.Popen:
+    argv = [
+        "escpr2-proxy",
+        printer_address,
+        f"127.0.0.1:{local_port}",
+        str(config_path),
+        "--dump",
+        "Off",
+        *proxy_args,
+    ]
+    proxy = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            f"import sys; sys.argv = {argv!r}; "
+            "from escpr2_tools.proxy import main; main()",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + PROXY_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proxy.poll() is not None:
+            raise RuntimeError(f"Proxy exited with {proxy.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", local_port), timeout=1).close()
+            return proxy
+        except OSError:
+            time.sleep(0.1)
+    stop_proxy(proxy)
+    raise RuntimeError("Proxy did not start listening")
+
+
+def stop_proxy(proxy: subprocess.Popen):
+    proxy.send_signal(signal.SIGINT)
+    try:
+        proxy.wait(10)
+    except subprocess.TimeoutExpired:
+        proxy.kill()
+        proxy.wait()
+
+
+def iter_split_body(body: bytes, split: int) -> Iterator[bytes]:
+    yield body[:split]
+    time.sleep(SPLIT_PAUSE)
+    yield body[split:]
+
+
+def send_jobs(
+    port: int, body: bytes, jobs: int, split: int | None = None
+) -> list[float]:
+    # One client sending its jobs one after another over a single connection.
+    # With split the body is sent chunked in two parts, like CUPS sends the
+    # IPP attributes and the document.
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    connection = http.client.HTTPSConnection("127.0.0.1", port, context=context)
+    latencies: list[float] = []
+    try:
+        for _ in range(jobs):
+            start = time.perf_counter()
+            connection.request(
+                "POST",
+                "/ipp/print",
+                body if split is None else iter_split_body(body, split),
+                {"content-type": "application/ipp"},
+            )
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f"Proxy answered {response.status}")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connection.close()
+    return latencies
+
+
+def run_load(
+    clients: int,
+    jobs_per_client: int,
+    pages: int,
+    raster_size: int,
+    proxy_args: list[str],
+    split_ipp_header: bool = False,
+) -> dict[str, Any]:
+    body = make_send_document(pages=pages, raster_size=raster_size)
+    split = None
+    if split_ipp_header:
+        message = parse_ipp_message(body)
+        assert message is not None
+        split = message.document_offset
+    printer = FakePrinter()
+    printer.start()
+    try:
+        with tempfile.TemporaryDirectory() as config_dir:
+            port = get_free_port()
+            proxy = start_proxy(
+                printer.get_address(),
+                port,
+                Path(config_dir) / "config.toml",
+                proxy_args,
+            )
+            try:
+                idle_rss = get_rss(proxy.pid)
+                with RssSampler(proxy.pid) as rss, ThreadPoolExecutor(clients) as pool:
+                    start = time.perf_counter()
+                    results = list(
+                        pool.map(
+                            lambda _: send_jobs(port, body, jobs_per_client, split),
+                            range(clients),
+                        )
+                    )
+                    seconds = time.perf_counter() - start
+            finally:
+                stop_proxy(proxy)
+    finally:
+        printer.stop()
+
+    latencies = [latency for result in results for latency in result]
+    received = printer.get_jobs()
+    return {
+        "jobs": len(latencies),
+        "seconds": seconds,
+        "mb_per_s": len(body) * len(latencies) / seconds / 1e6,
+        "latency_p50_seconds": percentile(latencies, 0.5),
+        "latency_p99_seconds": percentile(latencies, 0.99),
+        "latency_max_seconds": max(latencies, default=0.0),
+        "printer_received_bytes": sum(job.body_bytes for job in received),
+        "printer_received_bodies": sorted(job.body_bytes for job in received),
+        "printer_receive_p50_seconds": percentile(
+            [job.seconds for job in received], 0.5
+        ),
+        "proxy_idle_rss_bytes": idle_rss,
+        "proxy_peak_rss_bytes": rss.peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load",
+        description="Send concurrent synthetic jobs through escpr2-proxy to a fake "
+        "printer and report latency, throughput and proxy memory.",
+    )
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--jobs", type=int, default=4, help="Jobs per client")
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument(
+        "--raster-size", type=int, default=8 * 1024 * 1024, help="Bytes per page"
+    )
+    parser.add_argument(
+        "--proxy-arg",
+        action="append",
+        default=[],
+        help="Extra escpr2-proxy argument, e.g. --proxy-arg=--stream",
+    )
+    parser.add_argument(
+        "--split-ipp-header",
+        action="store_true",
+        help="Send the IPP attributes and the document as separate chunks",
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {
+        "commit": get_commit(),
+        "timestamp": time.time(),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parameters": {
+            "clients": args.clients,
+            "jobs_per_client": args.jobs,
+            "pages": args.pages,
+            "raster_size": args.raster_size,
+            "proxy_args": args.proxy_arg,
+            "split_ipp_header": args.split_ipp_header,
+        },
+        "results": run_load(
+            args.clients,
+            args.jobs,
+            args.pages,
+            args.raster_size,
+            args.proxy_arg,
+            args.split_ipp_header,
+        ),
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from benchmarks.synthetic import make_job, make_send_document
+from escpr2_tools.config import CachedConfig
+from escpr2_tools.decode_escpr import diff_two, get_commands_dict, print_single
+from escpr2_tools.escpr_commands import EscprCommandJSetj
+from escpr2_tools.proxy import ModifySendDocument, SendDocumentStream
+
+COMMAND_ITERATIONS: int = 10000
+STREAM_CHUNK_SIZE: int = 64 * 1024
+
+
+class FakeRequest:
+    def __init__(self, content: bytes) -> None:
+        self.method: str = "POST"
+        self.content: bytes = content
+        self.stream = False
+
+    def set_content(self, content: bytes):
+        self.content = content
+
+
+class FakeFlow:
+    def __init__(self, content: bytes) -> None:
+        self.request: FakeRequest = FakeRequest(content)
+        self.metadata: dict[str, Any] = {}
+
+
+def measure(
+    func: Callable[[], Any], repeat: int, processed_bytes: int
+) -> dict[str, float | int]:
+    # Best wall time of repeat runs, peak memory of a separate traced run
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        seconds = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            seconds = min(seconds, time.perf_counter() - start)
+
+        tracemalloc.start()
+        func()
+        _current, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "mb_per_s": processed_bytes / seconds / 1e6 if seconds else 0.0,
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def construct_and_serialise():
+    params = EscprCommandJSetj().__bytes__()[10:]
+    for _ in range(COMMAND_ITERATIONS):
+        cmd = EscprCommandJSetj(params)
+        cmd.PaperWidth = 2880
+        cmd.__bytes__()
+
+
+def run_benchmarks(
+    pages: int, raster_size: int, esc_density: float, repeat: int
+) -> dict[str, dict[str, float | int]]:
+    job_params: dict[str, Any] = {
+        "pages": pages,
+        "raster_size": raster_size,
+        "esc_density": esc_density,
+    }
+    job = make_job(**job_params)
+    other_job = make_job(**job_params, seed=1)
+    send_document = make_send_document(**job_params)
+
+    config = CachedConfig(Path(tempfile.gettempdir()) / "escpr2-bench-missing.toml")
+    modify_send_document = ModifySendDocument(config)
+
+    def stream_send_document():
+        stream = SendDocumentStream(config)
+        for i in range(0, len(send_document), STREAM_CHUNK_SIZE):
+            stream(send_document[i : i + STREAM_CHUNK_SIZE])
+        stream(b"")
+
+    return {
+        "get_commands_dict": measure(lambda: get_commands_dict(job), repeat, len(job)),
+        "print_single": measure(lambda: print_single(job), repeat, len(job)),
+        "diff_two": measure(
+            lambda: diff_two(job, other_job), repeat, len(job) + len(other_job)
+        ),
+        "command_construct_serialise": measure(
+            construct_and_serialise,
+            repeat,
+            COMMAND_ITERATIONS * EscprCommandJSetj.PARAMETER_LENGTH,
+        ),
+        "modify_send_document_request": measure(
+            lambda: modify_send_document.request(FakeFlow(send_document)),
+            repeat,
+            len(send_document),
+        ),
+        "send_document_stream": measure(
+            stream_send_document, repeat, len(send_document)
+        ),
+    }
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Benchmark the escpr2 decoder, command codec and proxy rewrite.",
+    )
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument(
+        "--raster-size", type=int, default=8 * 1024 * 1024, help="Bytes per page"
+    )
+    parser.add_argument(
+        "--esc-density",
+        type=float,
+        default=1 / 256,
+        help="Fraction of ESC bytes in the raster",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {
+        "commit": get_commit(),
+        "timestamp": time.time(),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "parameters": {
+            "pages": args.pages,
+            "raster_size": args.raster_size,
+            "esc_density": args.esc_density,
+            "repeat": args.repeat,
+        },
+        "results": run_benchmarks(
+            args.pages, args.raster_size, args.esc_density, args.repeat
+        ),
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
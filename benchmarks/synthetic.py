@@ -0,0 +1,117 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import random
+
+from escpr2_tools.constants import EPS_MTID_PLAIN
+from escpr2_tools.escpr_commands import (
+    EscprCommandDSnd,
+    EscprCommandJSetj,
+    EscprCommandPSetn,
+    EscprCommandPSttp,
+    EscprCommandQSeti,
+    EscprCommandQSetq,
+)
+from escpr2_tools.ipp import (
+    IPP_OPERATION_SEND_DOCUMENT,
+    IPP_TAG_CHARSET,
+    IPP_TAG_OPERATION_ATTRIBUTES,
+    IPP_VERSION_2_0,
+    IppAttribute,
+    IppAttributeGroup,
+    encode_ipp_message,
+)
+
+# A4 at 360 dpi
+PAPER_WIDTH: int = 2976
+PAPER_LENGTH: int = 4209
+
+
+def make_data_command(raster: bytes, position_y: int = 0) -> bytes:
+    d_snd = EscprCommandDSnd()
+    d_snd.PositionY = position_y
+    d_snd.DataSize = len(raster)
+    return d_snd.get_data_command(raster)
+
+
+def make_raster(size: int, esc_density: float, rng: random.Random) -> bytes:
+    # Random raster bytes where roughly esc_density of all bytes are ESC
+    raster = bytearray(rng.randbytes(size).replace(b"\x1b", b"\x00"))
+    for _ in range(int(size * esc_density)):
+        raster[rng.randrange(size)] = 0x1B
+    return bytes(raster)
+
+
+def make_job(
+    pages: int = 1,
+    raster_size: int = 1024 * 1024,
+    esc_density: float = 1 / 256,
+    band_size: int = 16 * 1024,
+    seed: int = 0,
+) -> bytes:
+    # raster_size is the number of raster bytes per page, split into data
+    # commands of band_size bytes
+    rng = random.Random(seed)
+
+    q_setq = EscprCommandQSetq()
+    q_setq.MediaTypeID = EPS_MTID_PLAIN
+    q_setq.ColorPlane = 0x03
+
+    j_setj = EscprCommandJSetj()
+    j_setj.PaperWidth = PAPER_WIDTH
+    j_setj.PaperLength = PAPER_LENGTH
+    j_setj.PrintableAreaWidth = PAPER_WIDTH
+    j_setj.PrintableAreaLength = PAPER_LENGTH
+
+    job = bytearray(
+        b"\x1b\x01@EJL 1284.4\n@EJL     \n"
+        + b"\x1b(R\x06\x00\x00ESCPR"
+        + q_setq.__bytes__()
+        + EscprCommandQSeti().__bytes__()
+        + j_setj.__bytes__()
+    )
+
+    band = make_raster(band_size, esc_density, rng)
+    for page_number in range(pages):
+        p_setn = EscprCommandPSetn()
+        p_setn.NextPage = page_number + 1
+        job += p_setn.__bytes__() + EscprCommandPSttp().__bytes__()
+        for band_number, band_start in enumerate(range(0, raster_size, band_size)):
+            job += make_data_command(
+                band[: min(band_size, raster_size - band_start)], band_number
+            )
+        job += b"\x1bp\x01\x00\x00\x00endp\x00"
+    job += b"\x1bj\x00\x00\x00\x00endj\x1b@"
+
+    return bytes(job)
+
+
+def make_send_document(**kwargs) -> bytes:
+    # make_job wrapped into an IPPv2 Send-Document request
+    return encode_ipp_message(
+        IPP_VERSION_2_0,
+        IPP_OPERATION_SEND_DOCUMENT,
+        1,
+        [
+            IppAttributeGroup(
+                IPP_TAG_OPERATION_ATTRIBUTES,
+                [IppAttribute("attributes-charset", IPP_TAG_CHARSET, [b"utf-8"])],
+            )
+        ],
+    ) + make_job(**kwargs)
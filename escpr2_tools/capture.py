@@ -0,0 +1,514 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import argparse
+import hashlib
+import json
+import lzma
+import mmap
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import zlib
+from collections.abc import Buffer, Callable
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import IO, NamedTuple
+
+from escpr2_tools.constants import PAPER_SIZES
+from escpr2_tools.decode_escpr import iter_data_blocks
+from escpr2_tools.escpr_commands import (
+    EscprCommandJSetj,
+    EscprCommandPSttp,
+    EscprCommandQSetq,
+)
+from escpr2_tools.tokenizer import index_commands
+
+# Blocks smaller than this are kept inline in the stream manifest
+MIN_BLOCK_SIZE: int = 256
+
+CODECS: dict[str, tuple[Callable[[Buffer], bytes], Callable[[bytes], bytes]]] = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    printer TEXT NOT NULL,
+    paper_size_id INTEGER,
+    media_type_id INTEGER,
+    original_size INTEGER NOT NULL,
+    rewritten_size INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_time ON jobs (time);
+CREATE INDEX IF NOT EXISTS jobs_printer ON jobs (printer, time);
+CREATE INDEX IF NOT EXISTS jobs_paper_size ON jobs (paper_size_id, time);
+CREATE INDEX IF NOT EXISTS jobs_media_type ON jobs (media_type_id, time);
+CREATE TABLE IF NOT EXISTS streams (
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    kind TEXT NOT NULL,
+    manifest BLOB NOT NULL,
+    PRIMARY KEY (job_id, kind)
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    hash BLOB PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+# Manifest segments: inline bytes or a reference to a raster block
+SEGMENT_INLINE: int = ord("I")
+SEGMENT_BLOCK: int = ord("B")
+
+
+class CapturedJob(NamedTuple):
+    id: int
+    time: float
+    printer: str
+    paper_size_id: int | None
+    media_type_id: int | None
+    original_size: int
+    rewritten_size: int | None
+
+
+def get_job_media(document: Buffer) -> tuple[int | None, int | None]:
+    # Paper size id and media type id from the job header
+    j_setj_header = EscprCommandJSetj.get_command_header()
+    q_setq_header = EscprCommandQSetq.get_command_header()
+    index = index_commands(
+        document,
+        [j_setj_header, q_setq_header],
+        stop=EscprCommandPSttp.get_command_header(),
+    )
+
+    paper_size_id = None
+    if index[j_setj_header]:
+        j_setj = EscprCommandJSetj(index[j_setj_header][0].params)
+        paper_size_id = PAPER_SIZES.get((j_setj.PaperWidth, j_setj.PaperLength))
+    media_type_id = None
+    if index[q_setq_header]:
+        media_type_id = EscprCommandQSetq(index[q_setq_header][0].params).MediaTypeID
+    return paper_size_id, media_type_id
+
+
+class CaptureArchive:
+    # Job archive in a single SQLite file. Raster blocks are stored once by
+    # their SHA-256, compressed with the archive's codec, and the streams
+    # only keep the commands in between. Not thread-safe.
+
+    def __init__(self, path: Path, compression: str = "zlib") -> None:
+        if compression not in CODECS:
+            raise ValueError(f"Unknown compression {compression}")
+        self.compression: str = compression
+        self.__db: sqlite3.Connection = sqlite3.connect(path)
+        self.__db.executescript(SCHEMA)
+
+    def add_job(
+        self,
+        printer: str,
+        original: Buffer,
+        rewritten: Buffer | None = None,
+        capture_time: float | None = None,
+    ) -> int:
+        paper_size_id, media_type_id = get_job_media(original)
+        with self.__db:
+            job_id = self.__db.execute(
+                "INSERT INTO jobs (time, printer, paper_size_id, media_type_id, "
+                "original_size, rewritten_size) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    time.time() if capture_time is None else capture_time,
+                    printer,
+                    paper_size_id,
+                    media_type_id,
+                    len(memoryview(original)),
+                    None if rewritten is None else len(memoryview(rewritten)),
+                ),
+            ).lastrowid
+            assert job_id is not None
+            self.__add_stream(job_id, "original", original)
+            if rewritten is not None:
+                self.__add_stream(job_id, "rewritten", rewritten)
+        return job_id
+
+    def find_jobs(
+        self,
+        printer: str | None = None,
+        paper_size_id: int | None = None,
+        media_type_id: int | None = None,
+        since: float | None = None,
+        until: float | None = None,
+    ) -> list[CapturedJob]:
+        conditions: list[str] = []
+        parameters: list[object] = []
+        for condition, value in (
+            ("printer = ?", printer),
+            ("paper_size_id = ?", paper_size_id),
+            ("media_type_id = ?", media_type_id),
+            ("time >= ?", since),
+            ("time < ?", until),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.__db.execute(
+            f"SELECT {', '.join(CapturedJob._fields)} FROM jobs {where} "
+            "ORDER BY time, id",
+            parameters,
+        )
+        return [CapturedJob(*row) for row in rows]
+
+    def read_stream(self, job_id: int, kind: str = "original") -> bytes:
+        row = self.__db.execute(
+            "SELECT manifest FROM streams WHERE job_id = ? AND kind = ?",
+            (job_id, kind),
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"No {kind} stream for job {job_id}")
+
+        manifest = memoryview(zlib.decompress(row[0]))
+        out = bytearray()
+        pos = 0
+        while pos < len(manifest):
+            segment_type = manifest[pos]
+            if segment_type == SEGMENT_INLINE:
+                length = int.from_bytes(manifest[pos + 1 : pos + 5], "little")
+                out += manifest[pos + 5 : pos + 5 + length]
+                pos += 5 + length
+            elif segment_type == SEGMENT_BLOCK:
+                out += self.__read_block(bytes(manifest[pos + 1 : pos + 33]))
+                pos += 33
+            else:
+                raise ValueError(f"Invalid manifest of job {job_id}")
+        return bytes(out)
+
+    def get_stored_size(self) -> int:
+        (blocks,) = self.__db.execute(
+            "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blocks"
+        ).fetchone()
+        (manifests,) = self.__db.execute(
+            "SELECT COALESCE(SUM(LENGTH(manifest)), 0) FROM streams"
+        ).fetchone()
+        return blocks + manifests
+
+    def close(self) -> None:
+        self.__db.close()
+
+    def __add_stream(self, job_id: int, kind: str, document: Buffer):
+        # The views are released before the caller may close a mapped document
+        with memoryview(document) as document_view, document_view.cast("B") as view:
+            manifest = self.__get_manifest(view)
+        self.__db.execute(
+            "INSERT INTO streams (job_id, kind, manifest) VALUES (?, ?, ?)",
+            (job_id, kind, zlib.compress(manifest)),
+        )
+
+    def __get_manifest(self, view: memoryview) -> bytearray:
+        manifest = bytearray()
+        pos = 0
+        for data_block in iter_data_blocks(view):
+            raster_end = min(
+                data_block.raster_offset + data_block.raster_length, len(view)
+            )
+            if raster_end - data_block.raster_offset < MIN_BLOCK_SIZE:
+                continue
+            add_inline_segment(manifest, view[pos : data_block.raster_offset])
+            manifest.append(SEGMENT_BLOCK)
+            manifest += self.__add_block(view[data_block.raster_offset : raster_end])
+            pos = raster_end
+        add_inline_segment(manifest, view[pos:])
+        return manifest
+
+    def __add_block(self, raster: memoryview) -> bytes:
+        digest = hashlib.sha256(raster).digest()
+        known = self.__db.execute(
+            "SELECT 1 FROM blocks WHERE hash = ?", (digest,)
+        ).fetchone()
+        if known is None:
+            compress, _ = CODECS[self.compression]
+            self.__db.execute(
+                "INSERT INTO blocks (hash, codec, size, data) VALUES (?, ?, ?, ?)",
+                (digest, self.compression, len(raster), compress(raster)),
+            )
+        return digest
+
+    def __read_block(self, digest: bytes) -> bytes:
+        row = self.__db.execute(
+            "SELECT codec, data FROM blocks WHERE hash = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Missing block {digest.hex()}")
+        _, decompress = CODECS[row[0]]
+        return decompress(row[1])
+
+
+def add_inline_segment(manifest: bytearray, data: memoryview):
+    if len(data) > 0:
+        manifest.append(SEGMENT_INLINE)
+        manifest += len(data).to_bytes(4, "little")
+        manifest += data
+
+
+class CaptureWriter:
+    # Writes captured jobs to a CaptureArchive from a worker thread, the
+    # request path only queues references to the job data. Jobs are dropped
+    # if the worker cannot keep up, bounded by the bytes they keep alive.
+    MAX_QUEUED_TASKS: int = 256
+    MAX_QUEUED_BYTES: int = 256 * 1024 * 1024
+    # How long close() waits for the queued jobs to be written
+    CLOSE_TIMEOUT: float = 30.0
+
+    def __init__(
+        self,
+        path: Path,
+        compression: str = "zlib",
+        max_queued_bytes: int = MAX_QUEUED_BYTES,
+    ) -> None:
+        if compression not in CODECS:
+            raise ValueError(f"Unknown compression {compression}")
+        self.path: Path = path
+        self.compression: str = compression
+        self.max_queued_bytes: int = max_queued_bytes
+        self.dropped: int = 0
+        self.__queue: queue.Queue[
+            tuple[Callable[[CaptureArchive], None], int] | None
+        ] = queue.Queue(self.MAX_QUEUED_TASKS)
+        self.__queued_bytes: int = 0
+        self.__lock: threading.Lock = threading.Lock()
+        self.__worker: threading.Thread | None = threading.Thread(
+            target=self.__work, name="capture", daemon=True
+        )
+        self.__worker.start()
+
+    def capture(self, printer: str, original: Buffer, rewritten: Buffer | None):
+        # original and rewritten must not be modified afterwards
+        size = len(memoryview(original))
+        if rewritten is not None:
+            size += len(memoryview(rewritten))
+        if not self.put(
+            partial(add_job, printer, original, rewritten, time.time()), size
+        ):
+            self.dropped += 1
+
+    def capture_stream(self, printer: str) -> "CaptureStream":
+        return CaptureStream(self, printer)
+
+    def put(self, task: Callable[[CaptureArchive], None], size: int = 0) -> bool:
+        # size is the number of bytes the task keeps alive until it has run.
+        # A single task larger than the limit is accepted if nothing else is
+        # queued, it holds no more than the request it was taken from.
+        with self.__lock:
+            if (
+                self.__queued_bytes > 0
+                and self.__queued_bytes + size > self.max_queued_bytes
+            ):
+                return False
+            try:
+                self.__queue.put_nowait((task, size))
+            except queue.Full:
+                return False
+            self.__queued_bytes += size
+        return True
+
+    def get_queued_bytes(self) -> int:
+        with self.__lock:
+            return self.__queued_bytes
+
+    def close(self, timeout: float = CLOSE_TIMEOUT):
+        if self.__worker is None:
+            return
+        try:
+            self.__queue.put(None, timeout=timeout)
+        except queue.Full:
+            print("Capture writer did not catch up, dropping queued jobs")
+        else:
+            self.__worker.join(timeout)
+        self.__worker = None
+
+    def __work(self):
+        # SQLite connections are bound to the thread that created them
+        archive = CaptureArchive(self.path, self.compression)
+        try:
+            while (item := self.__queue.get()) is not None:
+                task, size = item
+                try:
+                    task(archive)
+                except Exception as e:
+                    # The worker has to survive any job
+                    print(f"Could not capture job: {e!r}")
+                finally:
+                    # Release the job data before it is no longer counted
+                    del item, task
+                    with self.__lock:
+                        self.__queued_bytes -= size
+        finally:
+            archive.close()
+
+
+def add_job(
+    printer: str,
+    original: Buffer,
+    rewritten: Buffer | None,
+    capture_time: float,
+    archive: CaptureArchive,
+):
+    archive.add_job(printer, original, rewritten, capture_time)
+
+
+class CaptureStream:
+    # Spools the original and rewritten stream of a streamed job to
+    # temporary files on the capture worker, b"" ends a stream. The job is
+    # archived when both streams have ended.
+
+    def __init__(self, writer: CaptureWriter, printer: str) -> None:
+        self.writer: CaptureWriter = writer
+        self.printer: str = printer
+        self.time: float = time.time()
+        self.__dropped: bool = False
+        self.__files: dict[str, IO[bytes]] = {}
+        self.__open: set[str] = {"original", "rewritten"}
+
+    def original(self, data: Buffer):
+        self.__feed("original", data)
+
+    def rewritten(self, data: Buffer):
+        self.__feed("rewritten", data)
+
+    def __feed(self, kind: str, data: Buffer):
+        if not self.__dropped and not self.writer.put(
+            partial(self.__write, kind, data), len(memoryview(data))
+        ):
+            # An incomplete job is of no use
+            self.__dropped = True
+            self.writer.dropped += 1
+            self.writer.put(lambda archive: self.__close_files())
+
+    def __write(self, kind: str, data: Buffer, archive: CaptureArchive):
+        if len(memoryview(data)) > 0:
+            if kind not in self.__files:
+                self.__files[kind] = tempfile.TemporaryFile()
+            self.__files[kind].write(data)
+            return
+
+        self.__open.discard(kind)
+        if self.__open:
+            return
+        try:
+            with (
+                map_spool(self.__files.get("original")) as original,
+                map_spool(self.__files.get("rewritten")) as rewritten,
+            ):
+                archive.add_job(self.printer, original, rewritten, self.time)
+        finally:
+            self.__close_files()
+
+    def __close_files(self):
+        for spool in self.__files.values():
+            spool.close()
+        self.__files = {}
+
+
+class map_spool:
+    # Memory-maps a spool file, views into it must be released on exit
+
+    def __init__(self, spool: IO[bytes] | None) -> None:
+        self.spool: IO[bytes] | None = spool
+        self.__mapped: mmap.mmap | None = None
+
+    def __enter__(self) -> Buffer:
+        if self.spool is None or self.spool.tell() == 0:
+            return bytes()
+        self.spool.flush()
+        self.__mapped = mmap.mmap(self.spool.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.__mapped
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        if self.__mapped is None:
+            return
+        if exc_traceback is not None:
+            # The frames of a failed write still hold views into the map
+            traceback.clear_frames(exc_traceback)
+        self.__mapped.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        prog="escpr2-capture",
+        description="List and export jobs captured by escpr2-proxy --capture.",
+    )
+    parser.add_argument("archive", help="Capture archive file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="Print matching jobs as JSON lines")
+    list_parser.add_argument("--printer")
+    list_parser.add_argument("--paper-size", type=int, help="Paper size id")
+    list_parser.add_argument("--media-type", type=int, help="Media type id")
+    list_parser.add_argument("--since", help="ISO 8601 time")
+    list_parser.add_argument("--until", help="ISO 8601 time")
+
+    export_parser = commands.add_parser(
+        "export", help="Write a captured ESC/P-R stream for decode-escpr2"
+    )
+    export_parser.add_argument("job_id", type=int)
+    export_parser.add_argument("output")
+    export_parser.add_argument(
+        "--rewritten",
+        action="store_true",
+        help="Export the stream sent to the printer instead of the original",
+    )
+    args = parser.parse_args()
+
+    archive = CaptureArchive(Path(args.archive))
+    try:
+        if args.command == "list":
+            for job in archive.find_jobs(
+                args.printer,
+                args.paper_size,
+                args.media_type,
+                (
+                    datetime.fromisoformat(args.since).timestamp()
+                    if args.since
+                    else None
+                ),
+                (
+                    datetime.fromisoformat(args.until).timestamp()
+                    if args.until
+                    else None
+                ),
+            ):
+                json.dump(job._asdict(), sys.stdout)
+                print()
+        else:
+            stream = archive.read_stream(
+                args.job_id, "rewritten" if args.rewritten else "original"
+            )
+            with open(args.output, "wb") as f:
+                f.write(stream)
+    finally:
+        archive.close()
+    return 0
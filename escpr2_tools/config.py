@@ -1,6 +1,8 @@
 import argparse
+import os
 from enum import Enum
 from pathlib import Path
+from typing import NamedTuple
 import tomlkit
 
 
@@ -29,6 +31,88 @@ class Config:
             tomlkit.dump(self.__inner, cf)
 
 
+class CachedConfig:
+    # Read-only view of the print mode. The file is stat'ed on every read, so
+    # a change applies to the next job, but only parsed again if its inode,
+    # mtime or size changed.
+
+    def __init__(self, config_path: Path) -> None:
+        self.config_path: Path = config_path
+        # Incremented whenever the print mode changes, can be used to invalidate
+        # derived caches
+        self.version: int = 0
+        self.__snapshot: tuple[tuple[int, int, int] | None, PrintMode] = (
+            (-1, -1, -1),
+            PrintMode.Auto,
+        )
+
+    def get_print_mode(self) -> PrintMode:
+        self.reload_if_changed()
+        return self.__snapshot[1]
+
+    def reload_if_changed(self) -> bool:
+        try:
+            st = os.stat(self.config_path)
+            key: tuple[int, int, int] | None = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError as e:
+            key = None
+            stat_error = e
+
+        if key == self.__snapshot[0]:
+            return False
+
+        mode = PrintMode.Auto
+        if key is None:
+            print(f"Could not read config file: {stat_error}")
+        else:
+            try:
+                mode = Config(self.config_path, create=False).get_print_mode()
+            except IOError as e:
+                print(f"Could not read config file: {e}")
+                key = None
+            except (ValueError, KeyError, TypeError) as e:
+                # Invalid or half-written file (tomlkit's ParseError is a
+                # ValueError), keep the previous mode until the file changes
+                print(f"Invalid config file {self.config_path}: {e!r}")
+                mode = self.__snapshot[1]
+
+        changed = mode != self.__snapshot[1]
+        # Single reference swap, readers see either the old or the new snapshot
+        self.__snapshot = (key, mode)
+        if changed:
+            self.version += 1
+        return changed
+
+
+class PrinterConfig(NamedTuple):
+    printer_address: str
+    local_address: str
+    config_path: Path
+
+
+def load_printer_table(table_path: Path) -> list[PrinterConfig]:
+    # [[printer]] entries with address, listen and config keys,
+    # relative config paths are relative to the table
+    with open(table_path) as tf:
+        table = tomlkit.load(tf)
+
+    printers: list[PrinterConfig] = []
+    for entry in table.get("printer", []):
+        try:
+            printers.append(
+                PrinterConfig(
+                    str(entry["address"]),
+                    str(entry["listen"]),
+                    table_path.parent / str(entry["config"]),
+                )
+            )
+        except KeyError as e:
+            raise ValueError(f"Missing key {e} in printer table entry {entry}")
+    if not printers:
+        raise ValueError(f"No printers configured in {table_path}")
+    return printers
+
+
 def set_config_cli():
     parser = argparse.ArgumentParser(
         prog="escpr2-proxy-config",
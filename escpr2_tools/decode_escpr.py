@@ -1,129 +1,683 @@
-# escpr2-tools
-# Copyright (C) 2025  DerFetzer
-#
-# This file is part of escpr2-tools.
-#
-# escpr2-tools is free software: you can redistribute it and/or modify it under
-# the terms of the GNU General Public License as published by the Free Software
-# Foundation, either version 3 of the License, or (at your option) any later
-# version.
-#
-# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
-# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
-# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
-# details.
-#
-# You should have received a copy of the GNU General Public License along with
-# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
-#
-
-import sys
-
-from escpr2_tools.escpr_commands import COMMANDS, EscprCommand, EscprCommandUnknown
-
-
-def main() -> int:
-    if len(sys.argv) == 2:
-        file_name = sys.argv[1]
-        with open(file_name, "rb") as f:
-            file_bytes = f.read()
-        print_single(file_bytes)
-    if len(sys.argv) == 3:
-        ref_file_name = sys.argv[1]
-        with open(ref_file_name, "rb") as f:
-            ref_file_bytes = f.read()
-        file_name = sys.argv[2]
-        with open(file_name, "rb") as f:
-            file_bytes = f.read()
-        diff_two(ref_file_bytes, file_bytes)
-    else:
-        raise ValueError("Call this program with one or two binary files")
-
-    return 0
-
-
-def print_single(file_bytes: bytes):
-    commands_dict = get_commands_dict(file_bytes)
-    print_commands_dict(commands_dict)
-
-
-def diff_two(ref_file_bytes: bytes, file_bytes: bytes):
-    ref_commands_dict = get_commands_dict(ref_file_bytes)
-    commands_dict = get_commands_dict(file_bytes)
-
-    print("Reference:")
-    print_commands_dict(ref_commands_dict)
-
-    print("Other:")
-    print_commands_dict(commands_dict)
-
-    print("Reference vs. Other")
-    diff_commands_dicts(ref_commands_dict, commands_dict)
-
-    print()
-    print("Other vs. Reference")
-    diff_commands_dicts(commands_dict, ref_commands_dict)
-
-
-def diff_commands_dicts(
-    ref_commands_dict: dict[bytes, type[EscprCommand] | EscprCommandUnknown],
-    commands_dict: dict[bytes, type[EscprCommand] | EscprCommandUnknown],
-):
-    for header, command in ref_commands_dict.items():
-        if header not in commands_dict.keys():
-            print(
-                f"\n{command.get_command_description()} is not in commands dict\n{str(command)}"
-            )
-            continue
-        elif command != commands_dict[header]:
-            print(
-                f"\nArguments differ for {command.get_command_description()}:\n{str(command)}\n{str(commands_dict[header])}"
-            )
-        else:
-            print(
-                f"\nArguments for {command.get_command_description()} are equal\n{str(command)}"
-            )
-
-
-def print_commands_dict(
-    commands_dict: dict[bytes, type[EscprCommand] | EscprCommandUnknown],
-):
-    for _header, command in commands_dict.items():
-        print(str(command))
-
-        print()
-
-
-def get_commands_dict(
-    file_bytes: bytes,
-) -> dict[bytes, type[EscprCommand] | EscprCommandUnknown]:
-    commands_dict: dict[bytes, type[EscprCommand] | EscprCommandUnknown] = {}
-    commands = file_bytes.split(b"\x1b")
-
-    inside_data = False
-    for command in commands:
-        if inside_data:
-            if b"ESCPR" in command:
-                inside_data = False
-            continue
-
-        if len(command) == 0 or command[0] < 0x61 or command[0] > 0x7A:
-            # non lowercase letter
-            continue
-
-        if command.startswith(b"d") or command.startswith(b"(d"):
-            # data
-            inside_data = True
-            continue
-
-        header = command[:9]
-        params = command[9:50]
-
-        cmd_class = COMMANDS.get(header)
-
-        if cmd_class is not None:
-            commands_dict[header] = cmd_class(params)
-        else:
-            commands_dict[header] = EscprCommandUnknown(header, params)
-
-    return commands_dict
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import argparse
+import contextlib
+import glob
+import json
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+from bisect import bisect_left
+from collections import deque
+from collections.abc import Buffer, Callable, Generator, Iterable, Iterator
+from enum import Enum
+from functools import partial
+from pathlib import Path
+from typing import Any, NamedTuple, TextIO
+
+from escpr2_tools.escpr_commands import (
+    EscprCommand,
+    EscprCommandDSnd,
+    EscprCommandPSttp,
+    EscprCommandQSeti,
+    EscprCommandQSetq,
+    EscprCommandUnknown,
+)
+from escpr2_tools.tokenizer import (
+    ESCPR_HEADER_LENGTH,
+    EscprToken,
+    EscprTokenizer,
+    tokenize,
+)
+
+
+class DecodedCommand(NamedTuple):
+    offset: int
+    command: EscprCommand | EscprCommandUnknown
+
+
+class EscprPage(NamedTuple):
+    # Indices [start, stop) of the page's commands in EscprJob.commands
+    start: int
+    stop: int
+    # Byte range of the page including its data commands
+    offset: int
+    end: int
+    # Indices [data_start, data_stop) of the page's EscprJob.data_blocks
+    data_start: int
+    data_stop: int
+
+
+class DataBlock(NamedTuple):
+    # Offset of the data command
+    offset: int
+    # Byte range of the raster data following the fixed EscprCommandDSnd part
+    raster_offset: int
+    raster_length: int
+    # q-seti CompressMode in effect for this block
+    compress_mode: int
+    parameters: EscprCommandDSnd
+
+
+class EscprJob:
+    def __init__(self) -> None:
+        self.commands: list[DecodedCommand] = []
+        # A page starts with p-sttp and lasts until the next p-sttp or the
+        # next job level command (j-*)
+        self.pages: list[EscprPage] = []
+        # Command header -> indices in commands
+        self.index: dict[bytes, list[int]] = {}
+        self.data_blocks: list[DataBlock] = []
+
+    def get_page_commands(self, page: int) -> list[DecodedCommand]:
+        return self.commands[self.pages[page].start : self.pages[page].stop]
+
+    def find(self, header: bytes, page: int | None = None) -> list[DecodedCommand]:
+        positions = self.index.get(header, [])
+        if page is not None:
+            start = bisect_left(positions, self.pages[page].start)
+            stop = bisect_left(positions, self.pages[page].stop)
+            positions = positions[start:stop]
+        return [self.commands[position] for position in positions]
+
+    def get_page_data_blocks(self, page: int) -> list[DataBlock]:
+        return self.data_blocks[
+            self.pages[page].data_start : self.pages[page].data_stop
+        ]
+
+    def get_bytes_per_pixel(self) -> int:
+        # q-setq ColorPlane, RGB if unknown
+        q_setq = self.find(EscprCommandQSetq.get_command_header())
+        if q_setq and q_setq[0].command.ColorPlane in (1, 3):
+            return q_setq[0].command.ColorPlane
+        return 3
+
+    def get_header_commands(self) -> list[DecodedCommand]:
+        # Commands before the first page
+        return self.commands[: self.pages[0].start if self.pages else None]
+
+
+# Number of commands to look ahead when the two jobs got out of step
+DIFF_WINDOW: int = 32
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        prog="decode-escpr2",
+        description="Decode an ESC/P-R job or diff it against a reference job.",
+    )
+    parser.add_argument(
+        "file", nargs="?", help="Job to decode or reference job to diff against"
+    )
+    parser.add_argument("other", nargs="?", help="Job to diff against the reference")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Print both jobs and all commands instead of only the differences",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print raster statistics of the job as JSON instead of its commands "
+        "(requires numpy)",
+    )
+    parser.add_argument(
+        "--batch",
+        nargs="+",
+        metavar="PATH",
+        help="Decode all jobs matching these files, directories or glob patterns "
+        "and print one JSON record per job",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes for --batch",
+    )
+    args = parser.parse_args()
+
+    if args.batch is not None:
+        decode_batch(expand_paths(args.batch), sys.stdout, args.jobs)
+    elif args.file is None:
+        parser.error("a file or --batch is required")
+    elif args.stats:
+        # Imported here as it depends on this module and on numpy
+        from escpr2_tools.raster_stats import get_raster_statistics
+
+        with map_file(args.file) as file_bytes:
+            stats = get_raster_statistics(file_bytes)
+        json.dump(stats.as_dict(), sys.stdout, indent=2)
+        print()
+    elif args.other is None:
+        with map_file(args.file) as file_bytes:
+            print_single(file_bytes)
+    elif args.full:
+        with map_file(args.file) as ref_file_bytes, map_file(args.other) as file_bytes:
+            diff_two(ref_file_bytes, file_bytes)
+    else:
+        diff_files(args.file, args.other, sys.stdout)
+
+    return 0
+
+
+@contextlib.contextmanager
+def map_file(file_name: str | os.PathLike) -> Iterator[Buffer]:
+    # Memory-maps the file instead of reading it, commands decoded from it
+    # must be released or detached before leaving the context
+    with open(file_name, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield bytes()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+def expand_paths(patterns: Iterable[str]) -> list[Path]:
+    paths: list[Path] = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(
+                sorted(path for path in Path(pattern).rglob("*") if path.is_file())
+            )
+        elif glob.has_magic(pattern):
+            paths.extend(
+                sorted(
+                    Path(path)
+                    for path in glob.glob(pattern, recursive=True)
+                    if os.path.isfile(path)
+                )
+            )
+        else:
+            paths.append(Path(pattern))
+    return paths
+
+
+def decode_batch(paths: list[Path], out: TextIO, jobs: int | None = None):
+    # Writes one JSON record per job in the order of paths
+    if jobs == 1:
+        records: Iterator[dict[str, Any]] = map(decode_file_record, paths)
+        for record in records:
+            out.write(json.dumps(record) + "\n")
+        return
+
+    # Only imported here, it pulls in multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(jobs) as executor:
+        for record in executor.map(decode_file_record, paths, chunksize=16):
+            out.write(json.dumps(record) + "\n")
+
+
+def decode_file_record(path: Path) -> dict[str, Any]:
+    try:
+        with map_file(path) as file_bytes:
+            return {
+                "path": str(path),
+                "size": len(memoryview(file_bytes)),
+            } | get_job_record(decode_job(file_bytes))
+    except (OSError, ValueError, struct.error) as e:
+        return {"path": str(path), "error": str(e)}
+
+
+def get_job_record(job: EscprJob) -> dict[str, Any]:
+    return {
+        "pages": [[page.offset, page.end] for page in job.pages],
+        "commands": [
+            {
+                "offset": offset,
+                "command": command.get_command_description(),
+                "parameters": command.get_parameter_dict(),
+            }
+            for offset, command in job.commands
+        ],
+    }
+
+
+def print_single(file_bytes: Buffer):
+    print_job(decode_job(file_bytes))
+
+
+def print_job(job: EscprJob):
+    page_starts = {
+        page.start: page_number for page_number, page in enumerate(job.pages)
+    }
+    for position, (offset, command) in enumerate(job.commands):
+        if position in page_starts:
+            print(f"Page {page_starts[position]}:")
+
+        print(f"{offset:#010x} {str(command)}")
+
+        print()
+
+
+class DumpMode(Enum):
+    Off = 1
+    Sync = 2
+    Background = 3
+
+
+class JobStreamPrinter:
+    # Prints a job fed in chunks like print_job, b"" ends the job
+
+    def __init__(self, title: str | None) -> None:
+        self.title: str | None = title
+        self.__tokenizer: EscprTokenizer = EscprTokenizer()
+        self.__page_number: int = 0
+
+    def __call__(self, data: Buffer) -> None:
+        if self.title is not None:
+            print(self.title)
+            self.title = None
+        if len(memoryview(data)) == 0:
+            self.__tokenizer.close()
+            return
+
+        p_sttp_header = EscprCommandPSttp.get_command_header()
+        for token in self.__tokenizer.feed(data):
+            if not token.is_escpr or token.is_data:
+                continue
+            if token.header == p_sttp_header:
+                print(f"Page {self.__page_number}:")
+                self.__page_number += 1
+
+            print(f"{token.offset:#010x} {str(token.to_command())}")
+
+            print()
+
+
+class JobDumper:
+    # Prints decoded jobs either synchronously or from a worker thread that
+    # takes already decoded jobs or chunks of streamed jobs from a bounded
+    # queue. Jobs are dropped if the worker cannot keep up.
+    MAX_QUEUED_JOBS: int = 16
+    MAX_QUEUED_CHUNKS: int = 256
+    # How long close() waits for the queued jobs to be printed
+    CLOSE_TIMEOUT: float = 5.0
+
+    def __init__(self, mode: DumpMode = DumpMode.Sync) -> None:
+        self.mode: DumpMode = mode
+        self.dropped: int = 0
+        self.__queue: queue.Queue[Callable[[], None] | None] = queue.Queue(
+            self.MAX_QUEUED_CHUNKS
+        )
+        self.__worker: threading.Thread | None = None
+        if mode == DumpMode.Background:
+            self.__worker = threading.Thread(
+                target=self.__work, name="job-dumper", daemon=True
+            )
+            self.__worker.start()
+
+    def dump(self, title: str | None, file_bytes: Buffer):
+        match self.mode:
+            case DumpMode.Off:
+                return
+            case DumpMode.Sync:
+                if title is not None:
+                    print(title)
+                print_single(file_bytes)
+            case DumpMode.Background:
+                if self.__queue.qsize() >= self.MAX_QUEUED_JOBS:
+                    self.dropped += 1
+                    return
+                self.__put(partial(print_titled_job, title, decode_job(file_bytes)))
+
+    def dump_stream(self, title: str | None) -> Callable[[Buffer], None]:
+        # Returns a function taking the job in chunks, b"" ends the job. In
+        # background mode the chunks are decoded by the worker, they must not
+        # be modified afterwards.
+        match self.mode:
+            case DumpMode.Off:
+                return lambda data: None
+            case DumpMode.Sync:
+                return JobStreamPrinter(title)
+
+        printer = JobStreamPrinter(title)
+        dropped = False
+
+        def feed(data: Buffer) -> None:
+            nonlocal dropped
+            if not dropped and not self.__put(partial(printer, data)):
+                # The rest of the job would not decode anyway
+                dropped = True
+
+        return feed
+
+    def close(self, timeout: float = CLOSE_TIMEOUT):
+        if self.__worker is None:
+            return
+        try:
+            self.__queue.put(None, timeout=timeout)
+        except queue.Full:
+            print("Job dumper did not catch up, dropping queued jobs", file=sys.stderr)
+        else:
+            self.__worker.join(timeout)
+        self.__worker = None
+
+    def __put(self, task: Callable[[], None]) -> bool:
+        try:
+            self.__queue.put_nowait(task)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def __work(self):
+        while (task := self.__queue.get()) is not None:
+            try:
+                task()
+            except Exception as e:
+                # stdout itself may be what failed
+                print(f"Could not dump job: {e!r}", file=sys.stderr)
+
+
+def print_titled_job(title: str | None, job: EscprJob):
+    if title is not None:
+        print(title)
+    print_job(job)
+
+
+def diff_two(ref_file_bytes: Buffer, file_bytes: Buffer):
+    ref_commands_dict = get_commands_dict(ref_file_bytes)
+    commands_dict = get_commands_dict(file_bytes)
+
+    print("Reference:")
+    print_commands_dict(ref_commands_dict)
+
+    print("Other:")
+    print_commands_dict(commands_dict)
+
+    print("Reference vs. Other")
+    diff_commands_dicts(ref_commands_dict, commands_dict)
+
+    print()
+    print("Other vs. Reference")
+    diff_commands_dicts(commands_dict, ref_commands_dict)
+
+
+def diff_commands_dicts(
+    ref_commands_dict: dict[bytes, EscprCommand | EscprCommandUnknown],
+    commands_dict: dict[bytes, EscprCommand | EscprCommandUnknown],
+):
+    for header, command in ref_commands_dict.items():
+        if header not in commands_dict.keys():
+            print(
+                f"\n{command.get_command_description()} is not in commands dict\n{str(command)}"
+            )
+            continue
+        elif command != commands_dict[header]:
+            print(
+                f"\nArguments differ for {command.get_command_description()}:\n{str(command)}\n{str(commands_dict[header])}"
+            )
+        else:
+            print(
+                f"\nArguments for {command.get_command_description()} are equal\n{str(command)}"
+            )
+
+
+def print_commands_dict(
+    commands_dict: dict[bytes, EscprCommand | EscprCommandUnknown],
+):
+    for _header, command in commands_dict.items():
+        print(str(command))
+
+        print()
+
+
+def diff_files(ref_file_name: str, file_name: str, out: TextIO):
+    # Writes one JSON object per differing command
+    with map_file(ref_file_name) as ref_file_bytes, map_file(file_name) as file_bytes:
+        differences = diff_streams(
+            iter_decoded_commands(ref_file_bytes), iter_decoded_commands(file_bytes)
+        )
+        try:
+            for difference in differences:
+                out.write(json.dumps(difference) + "\n")
+        finally:
+            differences.close()
+
+
+def diff_streams(
+    ref_commands: Iterator[DecodedCommand],
+    commands: Iterator[DecodedCommand],
+    window: int = DIFF_WINDOW,
+) -> Generator[dict[str, Any], None, None]:
+    # Aligns both command streams by position and header. If the headers at
+    # the current position differ, the next `window` commands of both streams
+    # are searched for the closest point where they are in step again.
+    ref_queue: deque[DecodedCommand] = deque()
+    other_queue: deque[DecodedCommand] = deque()
+
+    while True:
+        __fill_diff_queue(ref_queue, ref_commands, window)
+        __fill_diff_queue(other_queue, commands, window)
+
+        if not ref_queue and not other_queue:
+            return
+        if not other_queue:
+            yield __get_difference("removed", ref_queue.popleft(), None)
+            continue
+        if not ref_queue:
+            yield __get_difference("added", None, other_queue.popleft())
+            continue
+
+        ref_command, command = ref_queue[0], other_queue[0]
+        ref_header = ref_command.command.get_command_header()
+        header = command.command.get_command_header()
+
+        if ref_header == header:
+            ref_queue.popleft()
+            other_queue.popleft()
+            if ref_command.command != command.command:
+                yield __get_difference("changed", ref_command, command)
+            continue
+
+        added = __find_header(other_queue, ref_header)
+        removed = __find_header(ref_queue, header)
+        if added is not None and (removed is None or added <= removed):
+            for _ in range(added):
+                yield __get_difference("added", None, other_queue.popleft())
+        elif removed is not None:
+            for _ in range(removed):
+                yield __get_difference("removed", ref_queue.popleft(), None)
+        else:
+            yield __get_difference("removed", ref_queue.popleft(), None)
+            yield __get_difference("added", None, other_queue.popleft())
+
+
+def __fill_diff_queue(
+    diff_queue: deque[DecodedCommand], commands: Iterator[DecodedCommand], window: int
+):
+    while len(diff_queue) < window:
+        command = next(commands, None)
+        if command is None:
+            return
+        diff_queue.append(command)
+
+
+def __find_header(diff_queue: deque[DecodedCommand], header: bytes) -> int | None:
+    for position, command in enumerate(diff_queue):
+        if command.command.get_command_header() == header:
+            return position
+    return None
+
+
+def __get_difference(
+    change: str,
+    ref_command: DecodedCommand | None,
+    command: DecodedCommand | None,
+) -> dict[str, Any]:
+    described = ref_command if ref_command is not None else command
+    assert described is not None
+    return {
+        "change": change,
+        "command": described.command.get_command_description(),
+        "ref_offset": ref_command.offset if ref_command is not None else None,
+        "offset": command.offset if command is not None else None,
+        "ref_parameters": (
+            ref_command.command.get_parameter_dict()
+            if ref_command is not None
+            else None
+        ),
+        "parameters": (
+            command.command.get_parameter_dict() if command is not None else None
+        ),
+    }
+
+
+def iter_decoded_commands(file_bytes: Buffer) -> Iterator[DecodedCommand]:
+    for token in tokenize(file_bytes):
+        if not token.is_escpr or token.is_data:
+            continue
+        yield DecodedCommand(token.offset, token.to_command())
+
+
+def iter_commands(
+    file_bytes: Buffer,
+) -> Iterator[EscprCommand | EscprCommandUnknown]:
+    for decoded_command in iter_decoded_commands(file_bytes):
+        yield decoded_command.command
+
+
+def get_commands_dict(
+    file_bytes: Buffer,
+) -> dict[bytes, EscprCommand | EscprCommandUnknown]:
+    commands_dict: dict[bytes, EscprCommand | EscprCommandUnknown] = {}
+
+    for command in iter_commands(file_bytes):
+        commands_dict[command.get_command_header()] = command
+
+    return commands_dict
+
+
+def decode_job(file_bytes: Buffer) -> EscprJob:
+    job = EscprJob()
+    p_sttp_header = EscprCommandPSttp.get_command_header()
+    q_seti_header = EscprCommandQSeti.get_command_header()
+
+    page_start: int | None = None
+    page_offset = 0
+    page_end = 0
+    page_data_start = 0
+    compress_mode = 0
+
+    def close_page():
+        job.pages.append(
+            EscprPage(
+                page_start,
+                len(job.commands),
+                page_offset,
+                page_end,
+                page_data_start,
+                len(job.data_blocks),
+            )
+        )
+
+    for token in tokenize(file_bytes):
+        if not token.is_escpr:
+            continue
+
+        if page_start is not None and (
+            token.header == p_sttp_header or token.command_class == ord("j")
+        ):
+            close_page()
+            page_start = None
+
+        if token.header == p_sttp_header:
+            page_start = len(job.commands)
+            page_offset = token.offset
+            page_data_start = len(job.data_blocks)
+        if page_start is not None:
+            page_end = token.end
+
+        if token.is_data:
+            job.data_blocks.append(get_data_block(token, compress_mode))
+            continue
+
+        command = token.to_command()
+        if token.header == q_seti_header:
+            compress_mode = command.CompressMode
+
+        job.index.setdefault(token.header, []).append(len(job.commands))
+        job.commands.append(DecodedCommand(token.offset, command))
+
+    if page_start is not None:
+        close_page()
+
+    return job
+
+
+def iter_data_blocks(file_bytes: Buffer) -> Iterator[DataBlock]:
+    q_seti_header = EscprCommandQSeti.get_command_header()
+    compress_mode = 0
+
+    for token in tokenize(file_bytes):
+        if not token.is_escpr:
+            continue
+        if token.is_data:
+            yield get_data_block(token, compress_mode)
+        elif token.header == q_seti_header:
+            compress_mode = EscprCommandQSeti(token.params).CompressMode
+
+
+def get_data_block(token: EscprToken, compress_mode: int) -> DataBlock:
+    fixed_length = len(memoryview(token.params))
+    if fixed_length == EscprCommandDSnd.PARAMETER_LENGTH:
+        parameters = EscprCommandDSnd(token.params)
+    else:
+        parameters = EscprCommandDSnd()
+    raster_offset = token.offset + ESCPR_HEADER_LENGTH + fixed_length
+    return DataBlock(
+        token.offset,
+        raster_offset,
+        token.end - raster_offset,
+        compress_mode,
+        parameters,
+    )
+
+
+def is_blank_data_block(
+    file_bytes: Buffer, data_block: DataBlock, bytes_per_pixel: int
+) -> bool:
+    # True if the block only contains white (0xFF) pixels, stops at the first
+    # non-white run
+    view = memoryview(file_bytes).cast("B")
+    pos = data_block.raster_offset
+    end = pos + data_block.raster_length
+
+    if data_block.compress_mode != 1:
+        return not bytes(view[pos:end]).strip(b"\xff")
+
+    # Run-length encoded in pixel units, see raster_stats.decode_run_length
+    while pos < end:
+        counter = view[pos]
+        pos += 1
+        if counter < 128:
+            run_length = (counter + 1) * bytes_per_pixel
+        elif counter > 128:
+            run_length = bytes_per_pixel
+        else:
+            continue
+        if pos + run_length > end or bytes(view[pos : pos + run_length]).strip(b"\xff"):
+            return False
+        pos += run_length
+    return True
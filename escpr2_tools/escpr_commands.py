@@ -18,12 +18,38 @@
 #
 
 import struct
-from typing import override
+from collections.abc import Buffer
+from typing import Any, override
 from warnings import warn
-import unittest
 
 
-class EscprCommand:
+class EscprParameter:
+    # Data descriptor for a single field of PARAMETER_DEFS,
+    # the raw parameters are only decoded on first access
+    __slots__ = ("index",)
+
+    def __init__(self, index: int) -> None:
+        self.index: int = index
+
+    def __get__(self, instance: "EscprCommand | None", owner: type) -> Any:
+        if instance is None:
+            return self
+        return instance.get_parameters()[self.index]
+
+    def __set__(self, instance: "EscprCommand", value: int) -> None:
+        instance.set_parameter(self.index, value)
+
+
+class EscprCommandMeta(type):
+    def __new__(mcs, name: str, bases: tuple[type, ...], namespace: dict[str, Any]):
+        # Instances only store raw and decoded parameters, see EscprCommand
+        namespace.setdefault("__slots__", ())
+        return super().__new__(mcs, name, bases, namespace)
+
+
+class EscprCommand(metaclass=EscprCommandMeta):
+    __slots__ = ("__raw_parameters", "__parameters")
+
     NAME: str = ""
     COMMAND_CLASS: str = ""
     PARAMETER_LENGTH: int = 0
@@ -31,30 +57,57 @@ class EscprCommand:
 
     PARAMETER_DEFS: list[str | tuple[str, str]] = []
 
+    # Compiled from PARAMETER_DEFS when a subclass is defined
+    PARAMETER_NAMES: tuple[str, ...] = ()
+    PARAMETER_STRUCT: struct.Struct = struct.Struct(">")
+
+    # Built once when a subclass is defined
+    COMMAND_HEADER: bytes = b""
+    ESC_COMMAND_HEADER: bytes = b""
+
     @classmethod
     def get_command_header(cls) -> bytes:
-        return (
+        return cls.COMMAND_HEADER
+
+    @classmethod
+    def get_esc_command_header(cls) -> bytes:
+        return cls.ESC_COMMAND_HEADER
+
+    @classmethod
+    def __compile_command_header(cls):
+        cls.COMMAND_HEADER = (
             cls.COMMAND_CLASS[0].encode("ascii")
-            + bytes([cls.PARAMETER_LENGTH, 0x00, 0x00, 0x00])
+            + cls.PARAMETER_LENGTH.to_bytes(4, "little")
             + cls.COMMAND_NAME.encode("ascii")
         )
+        cls.ESC_COMMAND_HEADER = b"\x1b" + cls.COMMAND_HEADER
 
     @classmethod
-    def get_esc_command_header(cls) -> bytes:
-        return b"\x1b" + cls.get_command_header()
+    def check_parameter_defs(cls):
+        if cls.PARAMETER_STRUCT.size != cls.PARAMETER_LENGTH:
+            raise ValueError(
+                f"PARAMETER_LENGTH does not match calculated: {cls.PARAMETER_LENGTH} != {cls.PARAMETER_STRUCT.size}"
+            )
 
     @classmethod
-    def check_parameter_defs(cls):
-        calc_param_len = 0
+    def __compile_parameter_defs(cls):
+        parameter_names: list[str] = []
+        fmt = ">"
         for parameter_def in cls.PARAMETER_DEFS:
-            param_len = struct.calcsize(
-                cls.__get_name_and_fmt_from_def(parameter_def)[1]
-            )
-            calc_param_len += param_len
-        if calc_param_len != cls.PARAMETER_LENGTH:
-            raise ValueError(
-                f"PARAMETER_LENGTH does not match calculated: {cls.PARAMETER_LENGTH} != {calc_param_len}"
+            parameter_name, parameter_fmt = cls.__get_name_and_fmt_from_def(
+                parameter_def
             )
+            if parameter_fmt[0] in "@=<":
+                raise ValueError(
+                    f"Only big endian parameters are supported: {parameter_def}"
+                )
+            parameter_names.append(parameter_name)
+            fmt += parameter_fmt.lstrip(">!")
+
+        cls.PARAMETER_NAMES = tuple(parameter_names)
+        cls.PARAMETER_STRUCT = struct.Struct(fmt)
+        for index, parameter_name in enumerate(parameter_names):
+            setattr(cls, parameter_name, EscprParameter(index))
 
     @classmethod
     def __get_name_and_fmt_from_def(cls, parameter_def: str | tuple[str, str]):
@@ -68,39 +121,63 @@ class EscprCommand:
             raise RuntimeError(f"Invalid parameter definition: {parameter_def}")
         return parameter_name, fmt
 
-    def __init__(self, params: bytes | None = None):
-        self.check_parameter_defs()
-
-        parameter_offset = 0
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.__compile_parameter_defs()
+        cls.check_parameter_defs()
+        cls.__compile_command_header()
 
-        self.raw_parameters: bytes = (
-            params if params else bytes([0] * self.PARAMETER_LENGTH)
+    def __init__(self, params: Buffer | None = None):
+        # params may be a memoryview into a larger buffer, it is not copied
+        self.__raw_parameters: Buffer | None = (
+            params if params else bytes(self.PARAMETER_LENGTH)
         )
-        for parameter_def in self.PARAMETER_DEFS:
-            parameter_name, fmt = self.__get_name_and_fmt_from_def(parameter_def)
-            setattr(
-                self,
-                parameter_name,
-                struct.unpack_from(
-                    fmt, buffer=self.raw_parameters, offset=parameter_offset
-                )[0],
-            )
+        self.__parameters: tuple[int, ...] | list[int] | None = None
 
-            parameter_offset += struct.calcsize(fmt)
-        if parameter_offset != len(self.raw_parameters):
+        params_len = len(memoryview(self.__raw_parameters))
+        if params_len < self.PARAMETER_STRUCT.size:
+            raise struct.error(
+                f"{self.get_command_description()} requires {self.PARAMETER_STRUCT.size} bytes, got {params_len}"
+            )
+        if params_len > self.PARAMETER_STRUCT.size:
             warn(
-                f"Unused bytes remaining: {self.raw_parameters[parameter_offset:]}",
+                f"Unused bytes remaining: {bytes(memoryview(self.__raw_parameters)[self.PARAMETER_STRUCT.size:])}",
                 RuntimeWarning,
             )
 
+    @property
+    def raw_parameters(self) -> Buffer:
+        if self.__raw_parameters is None:
+            self.__raw_parameters = self.PARAMETER_STRUCT.pack(*self.get_parameters())
+        return self.__raw_parameters
+
+    def get_parameters(self) -> tuple[int, ...] | list[int]:
+        if self.__parameters is None:
+            self.__parameters = self.PARAMETER_STRUCT.unpack_from(self.raw_parameters)
+        return self.__parameters
+
+    def set_parameter(self, index: int, value: int):
+        parameters = list(self.get_parameters())
+        parameters[index] = value
+        self.__parameters = parameters
+        self.__raw_parameters = None
+
+    def get_parameter_dict(self) -> dict[str, int | str]:
+        return dict(zip(self.PARAMETER_NAMES, self.get_parameters()))
+
+    def detach(self) -> "EscprCommand":
+        # Copy the raw parameters out of the source buffer
+        if isinstance(self.__raw_parameters, memoryview):
+            self.__raw_parameters = bytes(self.__raw_parameters)
+        return self
+
     def get_command_description(self) -> str:
         return f"{self.COMMAND_CLASS}-{self.COMMAND_NAME} ({self.NAME})"
 
     @override
     def __str__(self) -> str:
         str_repr = f"{self.get_command_description()}: {{ "
-        for parameter_def in self.PARAMETER_DEFS:
-            parameter_name, __fmt = self.__get_name_and_fmt_from_def(parameter_def)
+        for parameter_name in self.PARAMETER_NAMES:
             parameter_value = getattr(self, parameter_name)
             str_repr += f"{parameter_name}={parameter_value} ({hex(parameter_value)}), "
         str_repr = str_repr[:-2] + " }"
@@ -119,18 +196,29 @@ class EscprCommand:
         return not self.__eq__(value)
 
     def __bytes__(self) -> bytes:
-        b = b"\x1b" + self.get_command_header()
-        for parameter_def in self.PARAMETER_DEFS:
-            parameter_name, fmt = self.__get_name_and_fmt_from_def(parameter_def)
-            b += struct.pack(fmt, getattr(self, parameter_name))
-        return b
+        return self.get_esc_command_header() + bytes(
+            memoryview(self.raw_parameters)[: self.PARAMETER_STRUCT.size]
+        )
 
 
 class EscprCommandUnknown:
-    def __init__(self, header: bytes, params: bytes):
+    __slots__ = ("header", "raw_parameters")
+
+    def __init__(self, header: bytes, params: Buffer):
         self.header: bytes = header
-        self.raw_parameters: bytes = params
-        self.parameters: dict[str, int] = {}
+        self.raw_parameters: Buffer = params
+
+    @property
+    def parameters(self) -> dict[str, int]:
+        return {}
+
+    def get_parameter_dict(self) -> dict[str, int | str]:
+        return {"raw_parameters": bytes(self.raw_parameters).hex()}
+
+    def detach(self) -> "EscprCommandUnknown":
+        if isinstance(self.raw_parameters, memoryview):
+            self.raw_parameters = bytes(self.raw_parameters)
+        return self
 
     def get_command_header(self) -> bytes:
         return self.header
@@ -140,7 +228,7 @@ class EscprCommandUnknown:
 
     @override
     def __str__(self) -> str:
-        return f"UnknownCommand ({self.header}): {self.raw_parameters}"
+        return f"UnknownCommand ({self.header}): {bytes(self.raw_parameters)}"
 
     @override
     def __eq__(self, value: object, /) -> bool:
@@ -225,6 +313,16 @@ class EscprCommandMSetm(EscprCommand):
     ]
 
 
+class EscprCommandPEndp(EscprCommand):
+    NAME: str = "PageEnd"
+    COMMAND_CLASS: str = "p"
+    PARAMETER_LENGTH: int = 1
+    COMMAND_NAME: str = "endp"
+
+    # 0 after the last page
+    PARAMETER_DEFS: list[str | tuple[str, str]] = ["NextPage"]
+
+
 class EscprCommandPSeti(EscprCommand):
     NAME: str = "PageImageProcessing"
     COMMAND_CLASS: str = "p"
@@ -353,12 +451,45 @@ class EscprCommandUChku(EscprCommand):
     ]
 
 
+class EscprCommandDSnd(EscprCommand):
+    # Fixed part of a raster data command, the raster data follows it. The
+    # header's parameter length covers both, so it is not part of COMMANDS.
+    NAME: str = "SendData"
+    COMMAND_CLASS: str = "d"
+    PARAMETER_LENGTH: int = 7
+    COMMAND_NAME: str = "dsnd"
+
+    PARAMETER_DEFS: list[str | tuple[str, str]] = [
+        ("PositionX", ">H"),
+        ("PositionY", ">H"),
+        "CompressMode",
+        ("DataSize", ">H"),
+    ]
+
+    @classmethod
+    def get_esc_data_header(cls, raster_length: int) -> bytes:
+        return (
+            b"\x1b"
+            + cls.COMMAND_CLASS[0].encode("ascii")
+            + (cls.PARAMETER_LENGTH + raster_length).to_bytes(4, "little")
+            + cls.COMMAND_NAME.encode("ascii")
+        )
+
+    def get_data_command(self, raster: bytes) -> bytes:
+        return (
+            self.get_esc_data_header(len(raster))
+            + bytes(memoryview(self.raw_parameters)[: self.PARAMETER_LENGTH])
+            + raster
+        )
+
+
 COMMANDS: dict[bytes, type[EscprCommand]] = {
     EscprCommandJSetj.get_command_header(): EscprCommandJSetj,
     EscprCommandMSetc.get_command_header(): EscprCommandMSetc,
     EscprCommandMSeti.get_command_header(): EscprCommandMSeti,
     EscprCommandMSetiShort.get_command_header(): EscprCommandMSetiShort,
     EscprCommandMSetm.get_command_header(): EscprCommandMSetm,
+    EscprCommandPEndp.get_command_header(): EscprCommandPEndp,
     EscprCommandPSeti.get_command_header(): EscprCommandPSeti,
     EscprCommandPSetn.get_command_header(): EscprCommandPSetn,
     EscprCommandPSetq.get_command_header(): EscprCommandPSetq,
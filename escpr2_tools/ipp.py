@@ -0,0 +1,183 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+from collections.abc import Buffer
+from typing import NamedTuple
+
+# RFC 8011, 5.4.15
+IPP_OPERATION_PRINT_JOB: int = 0x0002
+IPP_OPERATION_VALIDATE_JOB: int = 0x0004
+IPP_OPERATION_CREATE_JOB: int = 0x0005
+IPP_OPERATION_SEND_DOCUMENT: int = 0x0006
+IPP_OPERATION_CANCEL_JOB: int = 0x0008
+IPP_OPERATION_GET_JOB_ATTRIBUTES: int = 0x0009
+IPP_OPERATION_GET_JOBS: int = 0x000A
+IPP_OPERATION_GET_PRINTER_ATTRIBUTES: int = 0x000B
+
+IPP_STATUS_SUCCESSFUL_OK: int = 0x0000
+
+# RFC 8010, 3.5.1
+IPP_TAG_OPERATION_ATTRIBUTES: int = 0x01
+IPP_TAG_JOB_ATTRIBUTES: int = 0x02
+IPP_TAG_END_OF_ATTRIBUTES: int = 0x03
+IPP_TAG_PRINTER_ATTRIBUTES: int = 0x04
+IPP_TAG_UNSUPPORTED_ATTRIBUTES: int = 0x05
+# Tags below are delimiters, tags from here on are value tags
+IPP_TAG_FIRST_VALUE: int = 0x10
+
+IPP_TAG_INTEGER: int = 0x21
+IPP_TAG_BOOLEAN: int = 0x22
+IPP_TAG_ENUM: int = 0x23
+IPP_TAG_KEYWORD: int = 0x44
+IPP_TAG_URI: int = 0x45
+IPP_TAG_CHARSET: int = 0x47
+IPP_TAG_NATURAL_LANGUAGE: int = 0x48
+IPP_TAG_MIME_MEDIA_TYPE: int = 0x49
+IPP_TAG_NAME_WITHOUT_LANGUAGE: int = 0x42
+
+IPP_VERSION_1_1: tuple[int, int] = (1, 1)
+IPP_VERSION_2_0: tuple[int, int] = (2, 0)
+
+# Version (2), operation-id/status-code (2) and request-id (4)
+IPP_HEADER_LENGTH: int = 8
+
+
+class IppParseError(ValueError):
+    pass
+
+
+class IppAttribute(NamedTuple):
+    name: str
+    value_tag: int
+    # Values of a 1setOf attribute are collected in order
+    values: list[bytes]
+
+
+class IppAttributeGroup(NamedTuple):
+    tag: int
+    attributes: list[IppAttribute]
+
+
+class IppMessage(NamedTuple):
+    version: tuple[int, int]
+    # status-code for responses
+    operation_id: int
+    request_id: int
+    attribute_groups: list[IppAttributeGroup]
+    # Offset of the first byte after the end-of-attributes tag
+    document_offset: int
+
+    @property
+    def status_code(self) -> int:
+        return self.operation_id
+
+    def find_attribute(
+        self, name: str, group_tag: int | None = None
+    ) -> IppAttribute | None:
+        for group in self.attribute_groups:
+            if group_tag is not None and group.tag != group_tag:
+                continue
+            for attribute in group.attributes:
+                if attribute.name == name:
+                    return attribute
+        return None
+
+
+def parse_ipp_message(buf: Buffer) -> IppMessage | None:
+    # Returns None if buf does not contain the complete attribute section yet
+    view = memoryview(buf).cast("B")
+    end = len(view)
+
+    if end < IPP_HEADER_LENGTH:
+        return None
+
+    version = (view[0], view[1])
+    operation_id = int.from_bytes(view[2:4], "big")
+    request_id = int.from_bytes(view[4:8], "big")
+    attribute_groups: list[IppAttributeGroup] = []
+
+    pos = IPP_HEADER_LENGTH
+    while pos < end:
+        tag = view[pos]
+
+        if tag < IPP_TAG_FIRST_VALUE:
+            pos += 1
+            if tag == IPP_TAG_END_OF_ATTRIBUTES:
+                return IppMessage(
+                    version, operation_id, request_id, attribute_groups, pos
+                )
+            if tag == 0x00:
+                raise IppParseError(f"Invalid delimiter tag at offset {pos - 1}")
+            attribute_groups.append(IppAttributeGroup(tag, []))
+            continue
+
+        if not attribute_groups:
+            raise IppParseError(f"Attribute outside of a group at offset {pos}")
+
+        if pos + 3 > end:
+            return None
+        name_length = int.from_bytes(view[pos + 1 : pos + 3], "big")
+        name_end = pos + 3 + name_length
+        if name_end + 2 > end:
+            return None
+        value_length = int.from_bytes(view[name_end : name_end + 2], "big")
+        value_end = name_end + 2 + value_length
+        if value_end > end:
+            return None
+
+        value = bytes(view[name_end + 2 : value_end])
+        attributes = attribute_groups[-1].attributes
+        if name_length == 0:
+            # Additional value of the previous attribute
+            if not attributes:
+                raise IppParseError(f"Additional value without name at offset {pos}")
+            attributes[-1].values.append(value)
+        else:
+            try:
+                name = bytes(view[pos + 3 : name_end]).decode("ascii")
+            except UnicodeDecodeError as e:
+                raise IppParseError(f"Invalid attribute name at offset {pos}") from e
+            attributes.append(IppAttribute(name, tag, [value]))
+
+        pos = value_end
+
+    return None
+
+
+def encode_ipp_message(
+    version: tuple[int, int],
+    operation_id: int,
+    request_id: int,
+    attribute_groups: list[IppAttributeGroup],
+) -> bytes:
+    b = bytearray(
+        bytes(version) + operation_id.to_bytes(2, "big") + request_id.to_bytes(4, "big")
+    )
+    for group in attribute_groups:
+        b.append(group.tag)
+        for attribute in group.attributes:
+            name = attribute.name.encode("ascii")
+            for value in attribute.values:
+                b.append(attribute.value_tag)
+                b += len(name).to_bytes(2, "big") + name
+                b += len(value).to_bytes(2, "big") + value
+                # Additional values have an empty name
+                name = bytes()
+    b.append(IPP_TAG_END_OF_ATTRIBUTES)
+    return bytes(b)
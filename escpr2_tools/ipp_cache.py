@@ -0,0 +1,179 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import time
+from collections.abc import Callable
+from typing import NamedTuple
+
+
+from escpr2_tools.ipp import (
+    IPP_HEADER_LENGTH,
+    IPP_OPERATION_CANCEL_JOB,
+    IPP_OPERATION_CREATE_JOB,
+    IPP_OPERATION_GET_PRINTER_ATTRIBUTES,
+    IPP_OPERATION_PRINT_JOB,
+    IPP_OPERATION_SEND_DOCUMENT,
+    IppParseError,
+    parse_ipp_message,
+)
+from escpr2_tools.metrics import METRICS
+
+# Operations that change the printer attributes (printer-state, queued jobs)
+INVALIDATING_OPERATIONS: frozenset[int] = frozenset(
+    {
+        IPP_OPERATION_PRINT_JOB,
+        IPP_OPERATION_CREATE_JOB,
+        IPP_OPERATION_SEND_DOCUMENT,
+        IPP_OPERATION_CANCEL_JOB,
+    }
+)
+
+# successful-ok up to successful-ok-events-complete, RFC 8011 B.1.2
+IPP_STATUS_SUCCESSFUL_MAX: int = 0x00FF
+
+
+ATTRIBUTE_CACHE = METRICS.counter(
+    "escpr2_proxy_attribute_cache_total",
+    "Get-Printer-Attributes cache lookups by result (hit, miss)",
+    ("result",),
+)
+
+# Set again for every response sent from the cache
+HOP_BY_HOP_HEADERS: frozenset[bytes] = frozenset(
+    {b"connection", b"content-length", b"keep-alive", b"transfer-encoding"}
+)
+
+
+class CachedResponse(NamedTuple):
+    created: float
+    headers: list[tuple[bytes, bytes]]
+    content: bytes
+
+
+class PrinterCache:
+    def __init__(self) -> None:
+        # Request without request-id -> response
+        self.responses: dict[bytes, CachedResponse] = {}
+        # Incremented on every invalidation, responses to requests sent
+        # before are not stored
+        self.generation: int = 0
+
+
+class PrinterAttributeCache:
+    # Answers repeated Get-Printer-Attributes requests from a per-printer
+    # cache for ttl seconds, operations that change the printer state clear
+    # the cache of that printer
+    MAX_ENTRIES: int = 64
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.ttl: float = ttl
+        self.clock: Callable[[], float] = clock
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__printers: dict[str, PrinterCache] = {}
+
+    def request(self, flow):
+        if flow.request.method != "POST" or flow.response is not None:
+            return
+        printer = self.__get_printer(flow)
+
+        if flow.request.stream:
+            # Only print jobs are streamed
+            self.invalidate(flow)
+            return
+
+        content = flow.request.content
+        try:
+            message = parse_ipp_message(content)
+        except IppParseError:
+            return
+        if message is None:
+            return
+
+        if message.operation_id in INVALIDATING_OPERATIONS:
+            self.invalidate(flow)
+            return
+        if message.operation_id != IPP_OPERATION_GET_PRINTER_ATTRIBUTES:
+            return
+
+        key = get_request_key(flow.request.path, content)
+        cached = printer.responses.get(key)
+        if cached is not None and self.clock() - cached.created < self.ttl:
+            self.hits += 1
+            ATTRIBUTE_CACHE.inc(result="hit")
+            from mitmproxy import http
+
+            flow.response = http.Response.make(
+                200,
+                set_request_id(cached.content, message.request_id),
+                cached.headers,
+            )
+            return
+
+        self.misses += 1
+        ATTRIBUTE_CACHE.inc(result="miss")
+        flow.metadata["escpr2_attribute_cache"] = (key, printer.generation)
+
+    def response(self, flow):
+        if "escpr2_attribute_cache" not in flow.metadata:
+            return
+        key, generation = flow.metadata.pop("escpr2_attribute_cache")
+        printer = self.__get_printer(flow)
+        content = flow.response.content
+        if (
+            generation != printer.generation
+            or flow.response.status_code != 200
+            or content is None
+            or len(content) < IPP_HEADER_LENGTH
+            or int.from_bytes(content[2:4], "big") > IPP_STATUS_SUCCESSFUL_MAX
+        ):
+            return
+
+        if len(printer.responses) >= self.MAX_ENTRIES:
+            # Drop the oldest entry
+            printer.responses.pop(next(iter(printer.responses)))
+        printer.responses[key] = CachedResponse(
+            self.clock(),
+            [
+                (name, value)
+                for name, value in flow.response.headers.fields
+                if name.lower() not in HOP_BY_HOP_HEADERS
+            ],
+            content,
+        )
+
+    def invalidate(self, flow):
+        printer = self.__get_printer(flow)
+        printer.responses.clear()
+        printer.generation += 1
+
+    def __get_printer(self, flow) -> PrinterCache:
+        # One cache per proxy mode and thereby printer
+        return self.__printers.setdefault(
+            flow.client_conn.proxy_mode.full_spec, PrinterCache()
+        )
+
+
+def get_request_key(path: str, content: bytes) -> bytes:
+    # The request-id differs for every poll
+    return path.encode() + b"\0" + content[:4] + content[IPP_HEADER_LENGTH:]
+
+
+def set_request_id(content: bytes, request_id: int) -> bytes:
+    return content[:4] + request_id.to_bytes(4, "big") + content[IPP_HEADER_LENGTH:]
@@ -0,0 +1,221 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import contextlib
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prometheus text exposition format 0.0.4
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+
+SECONDS_BUCKETS: tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    30.0,
+    120.0,
+)
+BYTES_BUCKETS: tuple[float, ...] = tuple(
+    float(1 << shift) for shift in range(12, 32, 2)
+)
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(label_names: tuple[str, ...], labels: tuple[str, ...]) -> str:
+    if not label_names:
+        return ""
+    pairs = (
+        f'{name}="{escape_label_value(value)}"'
+        for name, value in zip(label_names, labels)
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.label_names: tuple[str, ...] = label_names
+        self.__values: dict[tuple[str, ...], float] = {}
+        self.__lock: threading.Lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self.__lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def get(self, **labels: object) -> float:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self.__lock:
+            return self.__values.get(key, 0)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self.__lock:
+            values = sorted(self.__values.items())
+        for key, value in values:
+            yield f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}"
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = SECONDS_BUCKETS,
+    ) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.label_names: tuple[str, ...] = label_names
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets)) + (float("inf"),)
+        # Labels -> (count per bucket, sum)
+        self.__values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+        self.__lock: threading.Lock = threading.Lock()
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self.__lock:
+            counts, total = self.__values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.__values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels: object) -> int:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self.__lock:
+            counts, _ = self.__values.get(key, ([0], 0.0))
+            return sum(counts)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self.__lock:
+            values = sorted(
+                (key, (list(counts), total))
+                for key, (counts, total) in self.__values.items()
+            )
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = format_labels(
+                    self.label_names + ("le",), key + (format_value(bucket),)
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.metrics: list[Counter | Histogram] = []
+        self.__server: ThreadingHTTPServer | None = None
+
+    def counter(
+        self, name: str, help: str, label_names: tuple[str, ...] = ()
+    ) -> Counter:
+        counter = Counter(name, help, label_names)
+        self.metrics.append(counter)
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = SECONDS_BUCKETS,
+    ) -> Histogram:
+        histogram = Histogram(name, help, label_names, buckets)
+        self.metrics.append(histogram)
+        return histogram
+
+    def render(self) -> str:
+        return "".join(
+            line + "\n" for metric in self.metrics for line in metric.render()
+        )
+
+    def start_server(self, host: str, port: int) -> None:
+        # Serves /metrics from a daemon thread
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.__server.daemon_threads = True
+        threading.Thread(
+            target=self.__server.serve_forever, name="metrics", daemon=True
+        ).start()
+
+    def get_server_address(self) -> tuple[str, int] | None:
+        if self.__server is None:
+            return None
+        host, port = self.__server.server_address[:2]
+        return str(host), int(port)
+
+    def stop_server(self) -> None:
+        if self.__server is None:
+            return
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__server = None
+
+
+# Metrics of the proxy
+METRICS: MetricsRegistry = MetricsRegistry()
@@ -0,0 +1,102 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+from collections.abc import Buffer, Iterator
+from typing import NamedTuple
+
+
+class PatchEdit(NamedTuple):
+    offset: int
+    delete_length: int
+    data: bytes
+
+
+class PatchPlan:
+    # Edits of a job by offset into the unmodified job, applied in one pass
+    # instead of rebuilding the job after every single edit
+
+    def __init__(self) -> None:
+        self.__edits: list[PatchEdit] = []
+
+    def insert(self, offset: int, data: bytes) -> None:
+        # Inserts at the same offset are applied in the order they were added
+        self.replace(offset, 0, data)
+
+    def delete(self, offset: int, length: int) -> None:
+        self.replace(offset, length, bytes())
+
+    def replace(self, offset: int, delete_length: int, data: bytes) -> None:
+        if offset < 0 or delete_length < 0:
+            raise ValueError(f"Invalid edit at offset {offset}")
+        self.__edits.append(PatchEdit(offset, delete_length, data))
+
+    def extend(self, other: "PatchPlan") -> None:
+        # Adds the edits of another plan for the same job
+        self.__edits.extend(other.__edits)
+
+    def moved(self, delta: int) -> "PatchPlan":
+        # The same edits for a buffer that has delta bytes in front of the job
+        plan = PatchPlan()
+        for edit in self.__edits:
+            plan.replace(edit.offset + delta, edit.delete_length, edit.data)
+        return plan
+
+    def get_edits(self) -> list[PatchEdit]:
+        edits = sorted(self.__edits, key=lambda edit: edit.offset)
+        end = 0
+        for edit in edits:
+            if edit.offset < end:
+                raise ValueError(f"Overlapping edit at offset {edit.offset}")
+            end = edit.offset + edit.delete_length
+        return edits
+
+    def get_size(self, source_length: int) -> int:
+        return source_length + sum(
+            len(edit.data) - edit.delete_length for edit in self.__edits
+        )
+
+    def iter_slices(self, source: Buffer) -> Iterator[memoryview | bytes]:
+        # The patched job as views into source and the inserted bytes,
+        # nothing is copied
+        view = memoryview(source).cast("B")
+        pos = 0
+        for edit in self.get_edits():
+            if edit.offset + edit.delete_length > len(view):
+                raise ValueError(f"Edit at offset {edit.offset} is out of range")
+            if edit.offset > pos:
+                yield view[pos : edit.offset]
+            if edit.data:
+                yield edit.data
+            pos = edit.offset + edit.delete_length
+        if pos < len(view):
+            yield view[pos:]
+
+    def apply(self, source: Buffer) -> bytearray:
+        # Copies source once into a buffer of the final size
+        out = bytearray(self.get_size(len(memoryview(source).cast("B"))))
+        out_view = memoryview(out)
+        pos = 0
+        for piece in self.iter_slices(source):
+            length = len(piece)
+            out_view[pos : pos + length] = piece
+            pos += length
+        return out
+
+    def __len__(self) -> int:
+        return len(self.__edits)
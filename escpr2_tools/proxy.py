@@ -20,20 +20,45 @@
 import argparse
 import asyncio
 from pathlib import Path
-import struct
-from venv import create
+from collections.abc import Buffer, Callable
+from typing import NamedTuple
 
-from mitmproxy.options import Options
 
-from escpr2_tools.config import Config, PrintMode
+from escpr2_tools.capture import CODECS, CaptureStream, CaptureWriter
+from escpr2_tools.config import (
+    CachedConfig,
+    PrintMode,
+    PrinterConfig,
+    load_printer_table,
+)
 from escpr2_tools.constants import PAPER_LUT_AUTOMATIC, PAPER_SIZES
-from escpr2_tools.decode_escpr import print_single
-from mitmproxy.tools.dump import DumpMaster
+from escpr2_tools.decode_escpr import (
+    DumpMode,
+    EscprPage,
+    JobDumper,
+    decode_job,
+    is_blank_data_block,
+)
 
+from escpr2_tools.patch import PatchPlan
+from escpr2_tools.metrics import BYTES_BUCKETS, METRICS
+from escpr2_tools.tokenizer import EscprToken, EscprTokenizer, index_commands
+from escpr2_tools.upstream import UpstreamTlsSessions
+from escpr2_tools.ipp_cache import PrinterAttributeCache
+from escpr2_tools.ipp import (
+    IPP_OPERATION_SEND_DOCUMENT,
+    IPP_VERSION_1_1,
+    IPP_VERSION_2_0,
+    IppMessage,
+    IppParseError,
+    parse_ipp_message,
+)
 from escpr2_tools.escpr_commands import (
     EscprCommandJSetj,
     EscprCommandMSeti,
     EscprCommandMSetm,
+    EscprCommandPEndp,
+    EscprCommandPSetn,
     EscprCommandPSttp,
     EscprCommandPSetq,
     EscprCommandQSetb,
@@ -42,40 +67,56 @@ from escpr2_tools.escpr_commands import (
 )
 
 
-def get_paper_size_id(buf: bytes) -> int | None:
-    j_setj_esc_header = EscprCommandJSetj.get_esc_command_header()
+# Commands the header rewrite looks at, collected in one pass up to p-sttp
+HEADER_COMMANDS: tuple[bytes, ...] = (
+    EscprCommandJSetj.COMMAND_HEADER,
+    EscprCommandPSttp.COMMAND_HEADER,
+    EscprCommandQSetq.COMMAND_HEADER,
+)
 
-    j_setj_start = buf.find(j_setj_esc_header)
 
-    if j_setj_start != -1:
-        j_setj_param_start = j_setj_start + len(j_setj_esc_header)
-        j_setj = EscprCommandJSetj(
-            buf[
-                j_setj_param_start : j_setj_param_start
-                + EscprCommandJSetj.PARAMETER_LENGTH
-            ]
-        )
+def index_job_header(buf: Buffer) -> dict[bytes, list[EscprToken]]:
+    return index_commands(buf, HEADER_COMMANDS, stop=EscprCommandPSttp.COMMAND_HEADER)
+
+
+def count_pages(document: Buffer) -> int:
+    p_sttp_header = EscprCommandPSttp.COMMAND_HEADER
+    return len(index_commands(document, [p_sttp_header])[p_sttp_header])
+
+
+def get_paper_dimensions(
+    buf: Buffer, index: dict[bytes, list[EscprToken]] | None = None
+) -> tuple[int, int] | None:
+    if index is None:
+        index = index_job_header(buf)
+    j_setj_tokens = index.get(EscprCommandJSetj.COMMAND_HEADER)
+
+    if j_setj_tokens:
+        j_setj = EscprCommandJSetj(j_setj_tokens[0].params)
         width = j_setj.PaperWidth
         height = j_setj.PaperLength
         print(f"Paper size: {width}x{height}")
-        return PAPER_SIZES.get((width, height))
+        return width, height
     else:
         return None
 
 
-def get_media_type_id(buf: bytes) -> int | None:
-    q_setq_esc_header = EscprCommandQSetq.get_esc_command_header()
+def get_paper_size_id(
+    buf: Buffer, index: dict[bytes, list[EscprToken]] | None = None
+) -> int | None:
+    dimensions = get_paper_dimensions(buf, index)
+    return PAPER_SIZES.get(dimensions) if dimensions is not None else None
 
-    q_setq_start = buf.find(q_setq_esc_header)
 
-    if q_setq_start != -1:
-        q_setq_param_start = q_setq_start + len(q_setq_esc_header)
-        q_setq = EscprCommandQSetq(
-            buf[
-                q_setq_param_start : q_setq_param_start
-                + EscprCommandQSetq.PARAMETER_LENGTH
-            ]
-        )
+def get_media_type_id(
+    buf: Buffer, index: dict[bytes, list[EscprToken]] | None = None
+) -> int | None:
+    if index is None:
+        index = index_job_header(buf)
+    q_setq_tokens = index.get(EscprCommandQSetq.COMMAND_HEADER)
+
+    if q_setq_tokens:
+        q_setq = EscprCommandQSetq(q_setq_tokens[0].params)
         media_type_id = q_setq.MediaTypeID
         print(f"Media type id: {media_type_id}")
         return media_type_id
@@ -83,92 +124,634 @@ def get_media_type_id(buf: bytes) -> int | None:
         return None
 
 
+STREAM_MIN_SIZE: int = 64 * 1024
+MAX_HEADER_SIZE: int = 1024 * 1024
+
+REQUESTS = METRICS.counter(
+    "escpr2_proxy_requests_total", "IPP requests by operation-id", ("operation",)
+)
+JOBS = METRICS.counter(
+    "escpr2_proxy_jobs_total", "Send-Document requests by outcome", ("outcome",)
+)
+JOB_BYTES = METRICS.histogram(
+    "escpr2_proxy_job_bytes",
+    "Size of forwarded ESC/P-R documents",
+    buckets=BYTES_BUCKETS,
+)
+JOB_PAGES = METRICS.counter("escpr2_proxy_pages_total", "Pages of forwarded jobs")
+BLANK_PAGES = METRICS.counter(
+    "escpr2_proxy_blank_pages_dropped_total", "Blank pages removed from jobs"
+)
+PRINT_MODES = METRICS.counter(
+    "escpr2_proxy_print_modes_total",
+    "Rewritten jobs by print mode and p-setq LUT",
+    ("mode", "lut"),
+)
+HEADER_INJECTIONS = METRICS.counter(
+    "escpr2_proxy_header_injection_cache_total",
+    "Header injection cache lookups by result (hit, miss)",
+    ("result",),
+)
+STAGE_SECONDS = METRICS.histogram(
+    "escpr2_proxy_stage_seconds",
+    "Time spent in each processing stage (ipp_detect, decode, blank_pages, "
+    "rewrite, forward)",
+    ("stage",),
+)
+
+
+def detect_send_document(message: IppMessage) -> bool:
+    REQUESTS.inc(operation=f"{message.operation_id:#06x}")
+    if message.operation_id != IPP_OPERATION_SEND_DOCUMENT:
+        return False
+
+    if message.version == IPP_VERSION_1_1:
+        # Win
+        print("detected Send-Document IPPv1.1")
+    elif message.version == IPP_VERSION_2_0:
+        # Linux
+        print("detected Send-Document IPPv2")
+    return True
+
+
+def read_print_mode(config: CachedConfig) -> PrintMode:
+    mode = config.get_print_mode()
+    print(f"Current print mode: {mode}")
+    return mode
+
+
+class HeaderInjection(NamedTuple):
+    # Inserted after the first p-sttp, None if the LUT is unknown
+    p_setq: bytes | None
+    lut: int | None
+    paper_size_id: int | None
+    # Inserted before j-setj, None if the paper size is unknown
+    before_j_setj: bytes | None
+
+
+def build_header_injection(
+    paper_dimensions: tuple[int, int] | None,
+    media_type_id: int | None,
+    mode: PrintMode,
+) -> HeaderInjection:
+    p_setq = EscprCommandPSetq()
+    p_setq.ColorPlane = 0x03
+    p_setq.GammaCorrect = 0xDC
+    match mode:
+        case PrintMode.Auto:
+            if media_type_id is not None:
+                p_setq.LUT = PAPER_LUT_AUTOMATIC.get(media_type_id, 6)
+        case PrintMode.CmOff:
+            p_setq.LUT = 0x04
+        case PrintMode.ABW:
+            p_setq.LUT = 0x07
+    lut_known = mode != PrintMode.Auto or media_type_id is not None
+
+    paper_size_id = (
+        PAPER_SIZES.get(paper_dimensions) if paper_dimensions is not None else None
+    )
+    before_j_setj = None
+    if paper_size_id is not None:
+        # m-seti + m-setm + u-chku
+        # Works only with all three
+        m_seti = EscprCommandMSeti()
+
+        m_setm = EscprCommandMSetm()
+        m_setm.MediaSizeID = paper_size_id
+        m_setm.DocumentType = 0x63
+
+        u_chku = EscprCommandUChku()
+        u_chku.NonCheckPrintMode = 1
+
+        q_setb = EscprCommandQSetb()
+        q_setb.MonoGamma = 0xDC
+
+        before_j_setj = (
+            (q_setb.__bytes__() if mode == PrintMode.ABW else bytes())
+            + m_seti.__bytes__()
+            + m_setm.__bytes__()
+            + u_chku.__bytes__()
+        )
+
+    return HeaderInjection(
+        p_setq.__bytes__() if lut_known else None,
+        p_setq.LUT if lut_known else None,
+        paper_size_id,
+        before_j_setj,
+    )
+
+
+class HeaderInjectionCache:
+    # Least recently used cache of the serialised header injections by job
+    # settings, cleared whenever the config is reloaded
+    MAX_ENTRIES: int = 32
+
+    def __init__(self, config: CachedConfig) -> None:
+        self.config: CachedConfig = config
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__version: int = config.version
+        self.__injections: dict[
+            tuple[tuple[int, int] | None, int | None, PrintMode], HeaderInjection
+        ] = {}
+
+    def get(
+        self,
+        paper_dimensions: tuple[int, int] | None,
+        media_type_id: int | None,
+        mode: PrintMode,
+    ) -> HeaderInjection:
+        if self.config.version != self.__version:
+            self.__injections.clear()
+            self.__version = self.config.version
+
+        key = (paper_dimensions, media_type_id, mode)
+        injection = self.__injections.pop(key, None)
+        if injection is not None:
+            self.hits += 1
+            HEADER_INJECTIONS.inc(result="hit")
+        else:
+            self.misses += 1
+            HEADER_INJECTIONS.inc(result="miss")
+            injection = build_header_injection(paper_dimensions, media_type_id, mode)
+            if len(self.__injections) >= self.MAX_ENTRIES:
+                # Drop the least recently used entry
+                self.__injections.pop(next(iter(self.__injections)))
+        # Most recently used entries are last
+        self.__injections[key] = injection
+        return injection
+
+    def __len__(self) -> int:
+        return len(self.__injections)
+
+
+def get_header_patch_plan(
+    content: Buffer,
+    mode: PrintMode,
+    injections: HeaderInjectionCache | None = None,
+    p_sttp_end: int | None = None,
+) -> PatchPlan | None:
+    # Only the job up to and including the first p-sttp is looked at
+    # p-setq is inserted at p_sttp_end instead if the first page is dropped
+    # Returns None if the job has to be dropped
+    index = index_job_header(content)
+    plan = PatchPlan()
+
+    p_sttp_tokens = index[EscprCommandPSttp.COMMAND_HEADER]
+    j_setj_tokens = index[EscprCommandJSetj.COMMAND_HEADER]
+    paper_dimensions = get_paper_dimensions(content, index) if j_setj_tokens else None
+    # The media type only matters for the automatic LUT
+    media_type_id = (
+        get_media_type_id(content, index)
+        if p_sttp_tokens and mode == PrintMode.Auto
+        else None
+    )
+    injection = (
+        injections.get(paper_dimensions, media_type_id, mode)
+        if injections is not None
+        else build_header_injection(paper_dimensions, media_type_id, mode)
+    )
+
+    if p_sttp_tokens:
+        print("p-sttp found")
+        if injection.p_setq is None:
+            raise ValueError("Could not get media type id")
+        plan.insert(
+            p_sttp_tokens[0].end if p_sttp_end is None else p_sttp_end,
+            injection.p_setq,
+        )
+        PRINT_MODES.inc(mode=mode.name, lut=injection.lut)
+
+    if j_setj_tokens:
+        print("j-setj found")
+        print(f"paper_size_id: {injection.paper_size_id}")
+        if injection.before_j_setj is None:
+            print("Could not determine paper size!")
+            return None
+        plan.insert(j_setj_tokens[0].offset, injection.before_j_setj)
+    return plan
+
+
+def modify_escpr_header(content: Buffer, mode: PrintMode) -> bytes | None:
+    plan = get_header_patch_plan(content, mode)
+    if plan is None:
+        return None
+    return b"".join(plan.iter_slices(content))
+
+
+class BlankPagePlan(NamedTuple):
+    plan: PatchPlan
+    # End of the p-sttp of the first page that is kept
+    p_sttp_end: int
+
+
+def get_blank_page_patch_plan(document: Buffer) -> BlankPagePlan | None:
+    # Drops pages without data commands or with white raster only and
+    # renumbers the remaining p-setn. Returns None if no page is blank.
+    job = decode_job(document)
+    bytes_per_pixel = job.get_bytes_per_pixel()
+    p_endp_header = EscprCommandPEndp.get_command_header()
+
+    blank = [
+        all(
+            is_blank_data_block(document, data_block, bytes_per_pixel)
+            for data_block in job.get_page_data_blocks(page_number)
+        )
+        for page_number in range(len(job.pages))
+    ]
+    if not any(blank):
+        return None
+    if all(blank):
+        # The printer still needs one page
+        blank[0] = False
+
+    def get_page_start(page: EscprPage) -> int:
+        if page.start > 0 and isinstance(
+            job.commands[page.start - 1].command, EscprCommandPSetn
+        ):
+            # p-setn announcing the page
+            return job.commands[page.start - 1].offset
+        return page.offset
+
+    plan = PatchPlan()
+    # (start, end) of the dropped pages
+    dropped: list[tuple[int, int]] = []
+    for page_number, page in enumerate(job.pages):
+        if not blank[page_number]:
+            continue
+        start = get_page_start(page)
+        end = page.end
+        p_endp = job.find(p_endp_header, page=page_number)
+        if p_endp:
+            # Anything after p-endp already belongs to the next page
+            end = p_endp[-1].offset + len(p_endp[-1].command.__bytes__())
+        elif page_number < len(job.pages) - 1:
+            # Without p-endp the page ends where the next one is announced
+            end = get_page_start(job.pages[page_number + 1])
+        plan.delete(start, end - start)
+        dropped.append((start, end))
+
+    for p_setn in job.find(EscprCommandPSetn.get_command_header()):
+        if any(start <= p_setn.offset < end for start, end in dropped):
+            continue
+        dropped_before = sum(end <= p_setn.offset for _, end in dropped)
+        if dropped_before:
+            renumbered = p_setn.command.detach()
+            renumbered.NextPage = max(renumbered.NextPage - dropped_before, 0)
+            plan.replace(
+                p_setn.offset,
+                len(p_setn.command.__bytes__()),
+                renumbered.__bytes__(),
+            )
+
+    last_page = max(i for i, is_blank in enumerate(blank) if not is_blank)
+    if last_page < len(job.pages) - 1:
+        # The new last page has to announce the end of the job
+        last_p_endp = job.find(p_endp_header, page=last_page)
+        final_p_endp = job.find(p_endp_header, page=len(job.pages) - 1)
+        if last_p_endp and final_p_endp:
+            end_p_endp = last_p_endp[-1].command.detach()
+            end_p_endp.NextPage = final_p_endp[-1].command.NextPage
+            plan.replace(
+                last_p_endp[-1].offset,
+                len(end_p_endp.__bytes__()),
+                end_p_endp.__bytes__(),
+            )
+
+    first_page = blank.index(False)
+    p_sttp = job.commands[job.pages[first_page].start]
+
+    print(f"Dropping {len(dropped)} blank page(s)")
+    BLANK_PAGES.inc(len(dropped))
+    return BlankPagePlan(plan, p_sttp.offset + len(p_sttp.command.__bytes__()))
+
+
+def remove_blank_pages(document: Buffer) -> bytes | None:
+    blank_page_plan = get_blank_page_patch_plan(document)
+    if blank_page_plan is None:
+        return None
+    plan = blank_page_plan.plan
+    return b"".join(plan.iter_slices(document))
+
+
+class SendDocumentStream:
+    # Holds back and rewrites the job header up to the first p-sttp only,
+    # everything after it (the raster data) is passed through untouched.
+    # The forwarded job is fed to the dumper chunk by chunk, so with
+    # DumpMode.Background it is decoded while it is uploaded.
+
+    def __init__(
+        self,
+        config: CachedConfig,
+        dumper: JobDumper | None = None,
+        capture: CaptureStream | None = None,
+        header_injections: HeaderInjectionCache | None = None,
+    ) -> None:
+        self.config: CachedConfig = config
+        self.dumper: JobDumper = dumper if dumper is not None else JobDumper()
+        self.header_injections: HeaderInjectionCache | None = header_injections
+        # Only jobs that were detected as Send-Document are captured
+        self.capture: CaptureStream | None = capture
+        self.__buffer: bytearray = bytearray()
+        self.__document_offset: int = 0
+        self.__scanned: int = 0
+        self.__state: str = "detect"
+        self.__dump: Callable[[Buffer], None] | None = None
+        # Counts pages and bytes of a rewritten job for the metrics
+        self.__page_tokenizer: EscprTokenizer | None = None
+        self.__pages: int = 0
+        self.__document_bytes: int = 0
+
+    def __call__(self, data: bytes) -> list[bytes]:
+        # mitmproxy sends an empty chunk as the end of a chunked body
+        chunk = self.__feed(data)
+        return [chunk] if len(chunk) > 0 else []
+
+    def __feed(self, data: bytes) -> bytes:
+        match self.__state:
+            case "passthrough":
+                if self.__dump is not None:
+                    self.__dump(data)
+                if self.__page_tokenizer is not None:
+                    self.__count(data)
+                    if self.capture is not None:
+                        self.capture.original(data)
+                        self.capture.rewritten(data)
+                return data
+            case "drop":
+                if self.capture is not None:
+                    self.capture.original(data)
+                return bytes()
+
+        self.__buffer += data
+        end_of_stream = len(data) == 0
+
+        if self.__state == "detect":
+            try:
+                with STAGE_SECONDS.time(stage="ipp_detect"):
+                    message = parse_ipp_message(self.__buffer)
+            except IppParseError as e:
+                print(f"Could not parse IPP request: {e}")
+                return self.__flush(bytes(self.__buffer))
+            if message is None:
+                if end_of_stream or len(self.__buffer) > MAX_HEADER_SIZE:
+                    return self.__flush(bytes(self.__buffer))
+                return bytes()
+            if not detect_send_document(message) or message.version != IPP_VERSION_2_0:
+                return self.__flush(bytes(self.__buffer))
+
+            self.__state = "header"
+            self.__document_offset = message.document_offset
+            self.__scanned = message.document_offset
+
+        p_sttp_header = EscprCommandPSttp.get_esc_command_header()
+        p_sttp_start = self.__buffer.find(
+            p_sttp_header,
+            max(self.__document_offset, self.__scanned - len(p_sttp_header) + 1),
+        )
+        self.__scanned = len(self.__buffer)
+
+        if p_sttp_start != -1:
+            return self.__rewrite(p_sttp_start + len(p_sttp_header), end_of_stream)
+        if end_of_stream:
+            return self.__rewrite(len(self.__buffer), end_of_stream)
+        if len(self.__buffer) > MAX_HEADER_SIZE:
+            print("No p-sttp found in job header, passing job through unmodified")
+            return self.__flush(bytes(self.__buffer))
+        return bytes()
+
+    def __rewrite(self, header_end: int, end_of_stream: bool) -> bytes:
+        header = bytes(self.__buffer[self.__document_offset : header_end])
+        with STAGE_SECONDS.time(stage="decode"):
+            self.dumper.dump(None, header)
+        mode = read_print_mode(self.config)
+        with STAGE_SECONDS.time(stage="rewrite"):
+            plan = get_header_patch_plan(header, mode, self.header_injections)
+            if plan is None:
+                JOBS.inc(outcome="dropped_unknown_paper_size")
+                if self.capture is not None:
+                    self.capture.original(
+                        bytes(self.__buffer[self.__document_offset :])
+                    )
+                    self.capture.rewritten(bytes())
+                    if end_of_stream:
+                        self.capture.original(bytes())
+                self.__state = "drop"
+                self.__buffer = bytearray()
+                return bytes()
+            original = bytes(self.__buffer[self.__document_offset :])
+            data = self.__flush(
+                b"".join(plan.moved(self.__document_offset).iter_slices(self.__buffer))
+            )
+        JOBS.inc(outcome="rewritten")
+        if self.capture is not None:
+            self.capture.original(original)
+            self.capture.rewritten(memoryview(data)[self.__document_offset :])
+            if end_of_stream:
+                self.capture.original(bytes())
+                self.capture.rewritten(bytes())
+        self.__dump = self.dumper.dump_stream("Modified:")
+        self.__dump(memoryview(data)[self.__document_offset :])
+        self.__page_tokenizer = EscprTokenizer()
+        self.__count(memoryview(data)[self.__document_offset :])
+        if end_of_stream:
+            self.__dump(bytes())
+            self.__count(bytes())
+        return data
+
+    def __count(self, data: Buffer):
+        if len(memoryview(data)) == 0:
+            JOB_BYTES.observe(self.__document_bytes)
+            JOB_PAGES.inc(self.__pages)
+            self.__page_tokenizer = None
+            return
+        assert self.__page_tokenizer is not None
+        self.__document_bytes += len(memoryview(data))
+        p_sttp_header = EscprCommandPSttp.get_command_header()
+        for token in self.__page_tokenizer.feed(data):
+            if token.header == p_sttp_header:
+                self.__pages += 1
+
+    def __flush(self, data: bytes) -> bytes:
+        self.__state = "passthrough"
+        self.__buffer = bytearray()
+        return data
+
+
 class ModifySendDocument:
-    def __init__(self, config_path: Path) -> None:
-        self.config_path: Path = config_path
+    def __init__(
+        self,
+        config: CachedConfig,
+        stream: bool = False,
+        dumper: JobDumper | None = None,
+        drop_blank_pages: bool = False,
+        capture: CaptureWriter | None = None,
+        printer: str = "",
+    ) -> None:
+        self.config: CachedConfig = config
+        self.stream: bool = stream
+        self.dumper: JobDumper = dumper if dumper is not None else JobDumper()
+        # Only applies to buffered requests, streamed pages are forwarded
+        # before it is known whether they are blank
+        self.drop_blank_pages: bool = drop_blank_pages
+        self.capture: CaptureWriter | None = capture
+        # Printer address recorded with captured jobs
+        self.printer: str = printer
+        self.header_injections: HeaderInjectionCache = HeaderInjectionCache(config)
+
+    def requestheaders(self, flow):
+        if not self.stream or flow.request.method != "POST":
+            return
+        content_length = flow.request.headers.get("content-length")
+        if content_length is not None:
+            # Small requests (attribute polling etc.) are handled buffered, as
+            # are requests with an invalid length
+            try:
+                if int(content_length) < STREAM_MIN_SIZE:
+                    return
+            except ValueError:
+                return
+
+        # The rewritten body has a different length
+        flow.request.headers.pop("content-length", None)
+        if flow.request.http_version.startswith("HTTP/1"):
+            flow.request.headers["transfer-encoding"] = "chunked"
+        flow.request.stream = SendDocumentStream(
+            self.config,
+            self.dumper,
+            (
+                self.capture.capture_stream(self.printer)
+                if self.capture is not None
+                else None
+            ),
+            self.header_injections,
+        )
 
     def request(self, flow):
+        if flow.request.stream:
+            # Already rewritten by SendDocumentStream
+            return
         if flow.request.method == "POST":
             print("detected POST")
-            if bytes([0x01, 0x01, 0x00, 0x06]) in flow.request.content:
-                # Win
-                print("detected Send-Document IPPv1.1")
-                content = flow.request.content
-                print_single(content)
-            if bytes([0x02, 0x00, 0x00, 0x06]) in flow.request.content:
-                # Linux
-                print("detected Send-Document IPPv2")
-                content = flow.request.content
-                print_single(content)
-
-                try:
-                    config = Config(self.config_path, create=False)
-                    mode = config.get_print_mode()
-                except IOError as e:
-                    print(f"Could not read config file: {e}")
-                    mode = PrintMode.Auto
-
-                print(f"Current print mode: {mode}")
-
-                before, sep, after = content.partition(
-                    EscprCommandPSttp.get_esc_command_header()
-                )
-                if sep:
-                    print("p-sttp found")
-                    p_setq = EscprCommandPSetq()
-                    p_setq.ColorPlane = 0x03
-                    p_setq.GammaCorrect = 0xDC
-                    match mode:
-                        case PrintMode.Auto:
-                            media_type_id = get_media_type_id(content)
-                            if media_type_id is None:
-                                raise ValueError("Could not get media type id")
-                            p_setq.LUT = PAPER_LUT_AUTOMATIC.get(media_type_id, 6)
-                        case PrintMode.CmOff:
-                            p_setq.LUT = 0x04
-                        case PrintMode.ABW:
-                            p_setq.LUT = 0x07
-
-                    content = before + sep + p_setq.__bytes__() + after
-
-                before, sep, after = content.partition(
-                    EscprCommandJSetj.get_esc_command_header()
+            content = original = flow.request.content
+            try:
+                with STAGE_SECONDS.time(stage="ipp_detect"):
+                    message = parse_ipp_message(content)
+            except IppParseError as e:
+                print(f"Could not parse IPP request: {e}")
+                return
+            if message is None or not detect_send_document(message):
+                return
+            flow.metadata["escpr2_send_document"] = True
+
+            document = memoryview(content)[message.document_offset :]
+            with STAGE_SECONDS.time(stage="decode"):
+                self.dumper.dump(None, document)
+            if message.version != IPP_VERSION_2_0:
+                JOBS.inc(outcome="unmodified")
+                return
+
+            document_offset = message.document_offset
+            blank_page_plan = None
+            if self.drop_blank_pages:
+                with STAGE_SECONDS.time(stage="blank_pages"):
+                    blank_page_plan = get_blank_page_patch_plan(document)
+
+            mode = read_print_mode(self.config)
+            with STAGE_SECONDS.time(stage="rewrite"):
+                # Only the header is rewritten, the raster data is not looked at.
+                # Both plans refer to the original document.
+                plan = get_header_patch_plan(
+                    document,
+                    mode,
+                    self.header_injections,
+                    blank_page_plan.p_sttp_end if blank_page_plan else None,
                 )
-                if sep:
-                    print("j-setj found")
-                    paper_size_id = get_paper_size_id(content)
-                    print(f"paper_size_id: {paper_size_id}")
-                    if paper_size_id is None:
-                        print("Could not determine paper size!")
-                        flow.request.set_content(bytes())
-                        return
-
-                    # m-seti + m-setm + u-chku
-                    # Works only with all three
-                    m_seti = EscprCommandMSeti()
-
-                    m_setm = EscprCommandMSetm()
-                    m_setm.MediaSizeID = paper_size_id
-                    m_setm.DocumentType = 0x63
-
-                    u_chku = EscprCommandUChku()
-                    u_chku.NonCheckPrintMode = 1
-
-                    q_setb = EscprCommandQSetb()
-                    q_setb.MonoGamma = 0xDC
-
-                    content = (
-                        before
-                        + (q_setb.__bytes__() if mode == PrintMode.ABW else bytes())
-                        + m_seti.__bytes__()
-                        + m_setm.__bytes__()
-                        + u_chku.__bytes__()
-                        + sep
-                        + after
-                    )
-                print("Modified:")
-                print_single(content)
-                flow.request.set_content(content)
+                if plan is None:
+                    JOBS.inc(outcome="dropped_unknown_paper_size")
+                    self.__capture(original, bytes(), document_offset)
+                    flow.request.set_content(bytes())
+                    return
+                if blank_page_plan is not None:
+                    plan.extend(blank_page_plan.plan)
+
+                # Copies the request once
+                content = b"".join(plan.moved(document_offset).iter_slices(content))
+            JOBS.inc(outcome="rewritten")
+            JOB_BYTES.observe(len(content) - document_offset)
+            JOB_PAGES.inc(count_pages(memoryview(content)[document_offset:]))
+            self.dumper.dump("Modified:", memoryview(content)[document_offset:])
+            self.__capture(original, content, document_offset)
+            flow.request.set_content(content)
+
+    def __capture(self, original: bytes, rewritten: bytes, document_offset: int):
+        if self.capture is not None:
+            # Both are immutable, the writer only keeps views of them
+            self.capture.capture(
+                self.printer,
+                memoryview(original)[document_offset:],
+                memoryview(rewritten)[document_offset:],
+            )
+
+    def response(self, flow):
+        if (
+            flow.response is None
+            or flow.request.timestamp_end is None
+            or not (flow.metadata.get("escpr2_send_document") or flow.request.stream)
+        ):
+            return
+        # Upload of the job to the printer until its response
+        STAGE_SECONDS.observe(
+            flow.response.timestamp_start - flow.request.timestamp_end,
+            stage="forward",
+        )
+
+
+class PrinterRouter:
+    # Dispatches every flow to the ModifySendDocument of the proxy mode (and
+    # thereby printer) it arrived on
+
+    def __init__(self, addons: dict[str, ModifySendDocument]) -> None:
+        self.addons: dict[str, ModifySendDocument] = addons
+
+    def requestheaders(self, flow):
+        addon = self.__get_addon(flow)
+        if addon is not None:
+            addon.requestheaders(flow)
+
+    def request(self, flow):
+        addon = self.__get_addon(flow)
+        if addon is not None:
+            addon.request(flow)
+
+    def response(self, flow):
+        addon = self.__get_addon(flow)
+        if addon is not None:
+            addon.response(flow)
+
+    def __get_addon(self, flow) -> ModifySendDocument | None:
+        return self.addons.get(flow.client_conn.proxy_mode.full_spec)
+
+
+def split_address(address: str, default_port: int) -> tuple[str, int]:
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit() or (":" in host and not host.endswith("]")):
+        # No port or an IPv6 address without brackets
+        return address, default_port
+    return host, int(port)
+
+
+def join_address(host: str, port: int) -> str:
+    if ":" in host and not host.startswith("["):
+        # IPv6 address without brackets
+        return f"[{host}]:{port}"
+    return f"{host}:{port}"
+
+
+def get_proxy_mode(printer: PrinterConfig) -> str:
+    printer_address = join_address(*split_address(printer.printer_address, 631))
+    local_address = join_address(*split_address(printer.local_address, 631))
+    return f"reverse:https://{printer_address}@{local_address}"
 
 
 def main():
@@ -176,24 +759,156 @@ def main():
         prog="escpr2-proxy",
         description="Spawns a proxy to inspect and manipulate escpr2 commands inside IPP.",
     )
-    parser.add_argument("printer_address")
-    parser.add_argument("local_address")
-    parser.add_argument("config_path")
+    parser.add_argument("printer_address", nargs="?")
+    parser.add_argument("local_address", nargs="?")
+    parser.add_argument("config_path", nargs="?")
+    parser.add_argument(
+        "--printers",
+        help="TOML table of [[printer]] entries with address, listen and config "
+        "to proxy several printers from one process",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream Send-Document bodies and only rewrite the job header",
+    )
+    parser.add_argument(
+        "--dump",
+        choices=[dump_mode.name for dump_mode in DumpMode],
+        default=DumpMode.Sync.name,
+        help="How to print decoded jobs, Background prints from a worker thread",
+    )
+    parser.add_argument(
+        "--drop-blank-pages",
+        action="store_true",
+        help="Remove pages without any ink from buffered Send-Document requests",
+    )
+    parser.add_argument(
+        "--attribute-cache-ttl",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Answer repeated Get-Printer-Attributes requests from a cache "
+        "for this long, 0 disables the cache",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="ADDRESS",
+        help="Serve Prometheus metrics on this address (default port 9631)",
+    )
+    parser.add_argument(
+        "--capture",
+        metavar="FILE",
+        help="Archive the original and rewritten Send-Document jobs in this "
+        "file, see escpr2-capture",
+    )
+    parser.add_argument(
+        "--capture-compression",
+        choices=list(CODECS.keys()),
+        default="zlib",
+        help="Compression of the raster data in the capture archive",
+    )
     args = parser.parse_args()
 
-    proxy_mode = f"reverse:https://{args.printer_address}:631@{args.local_address}:631"
+    if args.printers is not None:
+        printers = load_printer_table(Path(args.printers))
+    elif args.config_path is not None:
+        printers = [
+            PrinterConfig(
+                args.printer_address, args.local_address, Path(args.config_path)
+            )
+        ]
+    else:
+        parser.error(
+            "either printer_address, local_address and config_path or --printers is required"
+        )
 
     try:
-        asyncio.run(__start_proxy(proxy_mode, Path(args.config_path)))
+        asyncio.run(
+            __start_proxy(
+                printers,
+                args.stream,
+                DumpMode[args.dump],
+                args.drop_blank_pages,
+                args.attribute_cache_ttl,
+                args.metrics,
+                args.capture,
+                args.capture_compression,
+            )
+        )
     except KeyboardInterrupt:
         print("Stopping proxy...")
 
 
-async def __start_proxy(proxy_mode: str, config_path: Path):
-    opts = Options(mode=[proxy_mode], ssl_insecure=True)
+async def __start_proxy(
+    printers: list[PrinterConfig],
+    stream: bool,
+    dump_mode: DumpMode,
+    drop_blank_pages: bool,
+    attribute_cache_ttl: float,
+    metrics_address: str | None,
+    capture_path: str | None,
+    capture_compression: str,
+):
+    if metrics_address is not None:
+        METRICS.start_server(*split_address(metrics_address, 9631))
+    dumper = JobDumper(dump_mode)
+    capture = (
+        CaptureWriter(Path(capture_path), capture_compression)
+        if capture_path is not None
+        else None
+    )
+    configs: dict[Path, CachedConfig] = {}
+    addons: dict[str, ModifySendDocument] = {}
+    for printer in printers:
+        if printer.config_path not in configs:
+            configs[printer.config_path] = CachedConfig(printer.config_path)
+        addons[get_proxy_mode(printer)] = ModifySendDocument(
+            configs[printer.config_path],
+            stream,
+            dumper,
+            drop_blank_pages,
+            capture,
+            printer.printer_address,
+        )
+
+    # mitmproxy takes most of the startup time, only the proxy needs it
+    from mitmproxy.options import Options
+    from mitmproxy.tools.dump import DumpMaster
+
+    opts = Options(mode=list(addons.keys()), ssl_insecure=True)
     proxy = DumpMaster(opts)
-    proxy.addons.add(ModifySendDocument(config_path))
+    tls_sessions = UpstreamTlsSessions()
+    attribute_cache = PrinterAttributeCache(attribute_cache_ttl)
+    # Added after mitmproxy's own addons, which create the TLS connections
+    proxy.addons.add(tls_sessions)
+    if attribute_cache_ttl > 0:
+        proxy.addons.add(attribute_cache)
+    proxy.addons.add(PrinterRouter(addons))
 
     print("Starting proxy...")
-    await proxy.run()
+    try:
+        await proxy.run()
+    finally:
+        METRICS.stop_server()
+        dumper.close()
+        if capture is not None:
+            capture.close()
+            if capture.dropped:
+                print(f"Capture could not keep up, dropped {capture.dropped} job(s)")
+        for address, stats in tls_sessions.get_stats().items():
+            print(
+                f"Upstream TLS sessions {address}: "
+                f"{stats['hits']} resumed, {stats['misses']} full handshakes"
+            )
+        print(
+            "Header injection cache: "
+            f"{sum(addon.header_injections.hits for addon in addons.values())} hits, "
+            f"{sum(addon.header_injections.misses for addon in addons.values())} misses"
+        )
+        if attribute_cache_ttl > 0:
+            print(
+                f"Printer attribute cache: {attribute_cache.hits} hits, "
+                f"{attribute_cache.misses} misses"
+            )
     print("Stopping proxy...")
@@ -0,0 +1,181 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+from collections.abc import Buffer
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from escpr2_tools.decode_escpr import DataBlock, EscprJob, decode_job
+
+if TYPE_CHECKING:
+    import numpy as np
+
+COMPRESS_MODE_NONE: int = 0
+COMPRESS_MODE_RUN_LENGTH: int = 1
+
+# Names of the color planes by bytes per pixel (q-setq ColorPlane)
+COLOR_PLANES: dict[int, tuple[str, ...]] = {
+    1: ("K",),
+    3: ("C", "M", "Y"),
+}
+
+
+class PageStatistics(NamedTuple):
+    data_blocks: int
+    compressed_bytes: int
+    raster_bytes: int
+    # Data blocks that are completely white
+    blank_blocks: int
+    # Mean ink coverage between 0 and 1 per color plane
+    ink_coverage: dict[str, float]
+
+    @property
+    def compression_ratio(self) -> float:
+        return (
+            self.raster_bytes / self.compressed_bytes if self.compressed_bytes else 1.0
+        )
+
+
+class JobStatistics(NamedTuple):
+    bytes_per_pixel: int
+    pages: list[PageStatistics]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "bytes_per_pixel": self.bytes_per_pixel,
+            "pages": [
+                page._asdict() | {"compression_ratio": page.compression_ratio}
+                for page in self.pages
+            ],
+        }
+
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError(
+            "Raster statistics require numpy, install escpr2-tools[stats]"
+        ) from e
+    return numpy
+
+
+def get_raster_statistics(file_bytes: Buffer) -> JobStatistics:
+    return get_job_statistics(decode_job(file_bytes), file_bytes)
+
+
+def get_job_statistics(job: EscprJob, file_bytes: Buffer) -> JobStatistics:
+    np = import_numpy()
+    data = np.frombuffer(file_bytes, dtype=np.uint8)
+
+    bytes_per_pixel = job.get_bytes_per_pixel()
+    planes = COLOR_PLANES[bytes_per_pixel]
+
+    pages: list[PageStatistics] = []
+    for page_number in range(len(job.pages)):
+        data_blocks = job.get_page_data_blocks(page_number)
+        compressed_bytes = 0
+        raster_bytes = 0
+        blank_blocks = 0
+        ink = np.zeros(bytes_per_pixel, dtype=np.int64)
+
+        for data_block in data_blocks:
+            pixels = decode_data_block(data, data_block, bytes_per_pixel)
+            compressed_bytes += data_block.raster_length
+            raster_bytes += pixels.size
+            # 255 is white on all planes
+            block_ink = (255 - pixels.astype(np.int64)).sum(axis=0)
+            if not block_ink.any():
+                blank_blocks += 1
+            ink += block_ink
+
+        pixel_count = raster_bytes // bytes_per_pixel
+        pages.append(
+            PageStatistics(
+                len(data_blocks),
+                compressed_bytes,
+                raster_bytes,
+                blank_blocks,
+                {
+                    plane: float(ink[i]) / (255 * pixel_count) if pixel_count else 0.0
+                    for i, plane in enumerate(planes)
+                },
+            )
+        )
+
+    return JobStatistics(bytes_per_pixel, pages)
+
+
+def decode_data_block(
+    data: "np.ndarray", data_block: DataBlock, bytes_per_pixel: int
+) -> "np.ndarray":
+    # Returns the pixels of the block as an array of shape (n, bytes_per_pixel)
+    np = import_numpy()
+    raster = data[
+        data_block.raster_offset : data_block.raster_offset + data_block.raster_length
+    ]
+
+    if data_block.compress_mode != COMPRESS_MODE_RUN_LENGTH:
+        usable = len(raster) - len(raster) % bytes_per_pixel
+        return raster[:usable].reshape(-1, bytes_per_pixel)
+
+    return decode_run_length(raster, bytes_per_pixel)
+
+
+def decode_run_length(raster: "np.ndarray", bytes_per_pixel: int) -> "np.ndarray":
+    # PackBits style runs of whole pixels: a counter n < 128 is followed by
+    # n + 1 literal pixels, n > 128 by one pixel repeated 257 - n times.
+    # Only the counters are walked in Python, the pixels are gathered at once.
+    np = import_numpy()
+
+    starts: list[int] = []
+    counts: list[int] = []
+    steps: list[int] = []
+
+    raw = raster.tobytes()
+    pos = 0
+    end = len(raw)
+    while pos < end:
+        counter = raw[pos]
+        pos += 1
+        if counter < 128:
+            count = counter + 1
+            if pos + count * bytes_per_pixel > end:
+                break
+            starts.append(pos)
+            counts.append(count)
+            steps.append(bytes_per_pixel)
+            pos += count * bytes_per_pixel
+        elif counter > 128:
+            if pos + bytes_per_pixel > end:
+                break
+            starts.append(pos)
+            counts.append(257 - counter)
+            steps.append(0)
+            pos += bytes_per_pixel
+
+    if not counts:
+        return np.zeros((0, bytes_per_pixel), dtype=np.uint8)
+
+    counts_array = np.array(counts, dtype=np.int64)
+    run_starts = np.cumsum(counts_array) - counts_array
+    pixel_in_run = np.arange(counts_array.sum()) - np.repeat(run_starts, counts_array)
+    pixel_offsets = np.repeat(
+        np.array(starts, dtype=np.int64), counts_array
+    ) + pixel_in_run * np.repeat(np.array(steps, dtype=np.int64), counts_array)
+    return raster[pixel_offsets[:, None] + np.arange(bytes_per_pixel)]
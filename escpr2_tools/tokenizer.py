@@ -0,0 +1,203 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import re
+from collections.abc import Buffer, Generator, Iterable, Iterator
+from typing import NamedTuple
+
+from escpr2_tools.escpr_commands import (
+    COMMANDS,
+    EscprCommand,
+    EscprCommandDSnd,
+    EscprCommandUnknown,
+)
+
+ESC: int = 0x1B
+
+# ESC + class + 4 byte parameter length (LE) + 4 byte command name
+ESCPR_HEADER_LENGTH: int = 10
+# ESC + "(" + class + 2 byte parameter length (LE)
+ESCP2_HEADER_LENGTH: int = 5
+
+# Larger lengths are not plausible for anything but raster data
+MAX_COMMAND_LENGTH: int = 0xFFFF
+
+_ESC_PATTERN: re.Pattern[bytes] = re.compile(b"\x1b")
+
+
+class EscprToken(NamedTuple):
+    # Offset of the ESC byte in the stream
+    offset: int
+    # Command header without ESC: 9 bytes for ESC/P-R commands,
+    # "(" + class for ESC/P 2 style commands
+    header: bytes
+    # Declared parameter length
+    length: int
+    # Parameters as a view into the fed buffer. Data commands only include
+    # their fixed part (EscprCommandDSnd), the raster data is skipped.
+    params: Buffer
+
+    @property
+    def command_class(self) -> int:
+        return self.header[1] if self.header[0] == ord("(") else self.header[0]
+
+    @property
+    def is_escpr(self) -> bool:
+        return self.header[0] != ord("(")
+
+    @property
+    def is_data(self) -> bool:
+        return self.command_class == ord("d")
+
+    @property
+    def end(self) -> int:
+        header_length = ESCPR_HEADER_LENGTH if self.is_escpr else ESCP2_HEADER_LENGTH
+        return self.offset + header_length + self.length
+
+    def to_command(self) -> EscprCommand | EscprCommandUnknown:
+        cmd_class = COMMANDS.get(self.header)
+
+        if cmd_class is not None:
+            return cmd_class(self.params)
+        else:
+            return EscprCommandUnknown(self.header, self.params)
+
+
+class EscprTokenizer:
+    # Splits an ESC/P-R stream into commands by their declared lengths.
+    # Data commands are skipped without looking at their payload, so the
+    # raster is never scanned for ESC bytes.
+
+    def __init__(self) -> None:
+        self.__buffer: bytearray = bytearray()
+        # Stream offset of the first byte in __buffer
+        self.__offset: int = 0
+        # Payload bytes of the current data command still to be skipped
+        self.__skip: int = 0
+
+    def feed(self, data: Buffer) -> Generator[EscprToken, None, None]:
+        view = memoryview(data).cast("B")
+
+        if self.__skip:
+            skipped = min(self.__skip, len(view))
+            self.__skip -= skipped
+            self.__offset += skipped
+            view = view[skipped:]
+
+        if self.__buffer:
+            self.__buffer += view
+            buf: Buffer = self.__buffer
+        else:
+            buf = view
+
+        pos = yield from self.__scan(buf)
+        buf_len = len(memoryview(buf))
+
+        if pos > buf_len:
+            self.__skip = pos - buf_len
+            pos = buf_len
+        self.__offset += pos
+        self.__buffer = bytearray(memoryview(buf)[pos:])
+
+    def close(self) -> None:
+        # Whatever is left is an incomplete command
+        self.__offset += len(self.__buffer) + self.__skip
+        self.__buffer = bytearray()
+        self.__skip = 0
+
+    def __scan(self, buf: Buffer) -> Generator[EscprToken, None, int]:
+        # Returns the position up to which buf has been consumed
+        view = memoryview(buf)
+        end = len(view)
+        pos = 0
+
+        while pos < end:
+            match = _ESC_PATTERN.search(view, pos)
+            if match is None:
+                return end
+            pos = match.start()
+
+            if pos + 1 >= end:
+                return pos
+
+            command_class = view[pos + 1]
+
+            if 0x61 <= command_class <= 0x7A:
+                if pos + ESCPR_HEADER_LENGTH > end:
+                    return pos
+                header = bytes(view[pos + 1 : pos + ESCPR_HEADER_LENGTH])
+                length = int.from_bytes(header[1:5], "little")
+                params_start = pos + ESCPR_HEADER_LENGTH
+            elif command_class == ord("("):
+                if pos + ESCP2_HEADER_LENGTH > end:
+                    return pos
+                header = bytes(view[pos + 1 : pos + 3])
+                length = int.from_bytes(view[pos + 3 : pos + 5], "little")
+                params_start = pos + ESCP2_HEADER_LENGTH
+            else:
+                # ESC @, EJL and other sequences without a length
+                pos += 1
+                continue
+
+            token = EscprToken(self.__offset + pos, header, length, bytes())
+
+            if token.is_data:
+                if token.is_escpr:
+                    fixed_length = min(length, EscprCommandDSnd.PARAMETER_LENGTH)
+                    if params_start + fixed_length > end:
+                        return pos
+                    token = token._replace(
+                        params=view[params_start : params_start + fixed_length]
+                    )
+                yield token
+                pos = params_start + length
+                continue
+
+            if length > MAX_COMMAND_LENGTH:
+                pos += 1
+                continue
+
+            if params_start + length > end:
+                return pos
+
+            yield token._replace(params=view[params_start : params_start + length])
+            pos = params_start + length
+
+        return pos
+
+
+def tokenize(data: Buffer) -> Iterator[EscprToken]:
+    tokenizer = EscprTokenizer()
+    yield from tokenizer.feed(data)
+    tokenizer.close()
+
+
+def index_commands(
+    data: Buffer, headers: Iterable[bytes], stop: bytes | None = None
+) -> dict[bytes, list[EscprToken]]:
+    # Finds the commands with any of the headers in a single pass, scanning
+    # ends after the first command with the stop header
+    index: dict[bytes, list[EscprToken]] = {header: [] for header in headers}
+    for token in tokenize(data):
+        tokens = index.get(token.header)
+        if tokens is not None:
+            tokens.append(token)
+        if token.header == stop:
+            break
+    return index
@@ -0,0 +1,105 @@
+# escpr2-tools
+# Copyright (C) 2025  DerFetzer
+#
+# This file is part of escpr2-tools.
+#
+# escpr2-tools is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# escpr2-tools is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# escpr2-tools. If not, see <https://www.gnu.org/licenses/>.
+#
+
+from collections import Counter
+from typing import TYPE_CHECKING, Any
+
+from escpr2_tools.metrics import METRICS
+
+if TYPE_CHECKING:
+    from mitmproxy import tls
+    from mitmproxy.proxy import server_hooks
+    from OpenSSL import SSL
+
+TLS_HANDSHAKES = METRICS.counter(
+    "escpr2_proxy_upstream_tls_handshakes_total",
+    "Upstream TLS handshakes by printer and result (resumed, full)",
+    ("printer", "result"),
+)
+
+
+def session_reused(ssl_conn: "SSL.Connection") -> bool:
+    # pyOpenSSL has no public API for this
+    from OpenSSL import SSL
+
+    return bool(SSL._lib.SSL_session_reused(ssl_conn._ssl))  # type: ignore
+
+
+def get_address_key(address: tuple[Any, ...] | None) -> str:
+    if address is None:
+        return ""
+    host, port = address[:2]
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+
+class UpstreamTlsSessions:
+    # Resumes TLS sessions with the printers. mitmproxy opens one upstream
+    # connection per client connection and keeps it alive as long as the
+    # client does, so the handshake is what can be shared between the short
+    # lived connections of CUPS.
+
+    def __init__(self) -> None:
+        # Printer address -> last session
+        self.__sessions: dict[str, "SSL.Session"] = {}
+        # Server connection id -> (printer address, connection)
+        self.__connections: dict[str, tuple[str, "SSL.Connection"]] = {}
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+
+    def tls_start_server(self, tls_start: "tls.TlsData"):
+        # Runs after mitmproxy's TlsConfig has created the connection
+        if tls_start.ssl_conn is None or tls_start.is_dtls:
+            return
+        session = self.__sessions.get(get_address_key(tls_start.conn.address))
+        if session is not None:
+            tls_start.ssl_conn.set_session(session)
+
+    def tls_established_server(self, tls_data: "tls.TlsData"):
+        if tls_data.ssl_conn is None or tls_data.is_dtls:
+            return
+        address = get_address_key(tls_data.conn.address)
+        if session_reused(tls_data.ssl_conn):
+            self.hits[address] += 1
+            TLS_HANDSHAKES.inc(printer=address, result="resumed")
+        else:
+            self.misses[address] += 1
+            TLS_HANDSHAKES.inc(printer=address, result="full")
+        self.__store_session(address, tls_data.ssl_conn)
+        self.__connections[tls_data.conn.id] = (address, tls_data.ssl_conn)
+
+    def tls_failed_server(self, tls_data: "tls.TlsData"):
+        # The printer may have been restarted
+        self.__sessions.pop(get_address_key(tls_data.conn.address), None)
+
+    def server_disconnected(self, data: "server_hooks.ServerConnectionHookData"):
+        connection = self.__connections.pop(data.server.id, None)
+        if connection is not None:
+            # TLS 1.3 tickets only arrive after the handshake
+            self.__store_session(*connection)
+
+    def get_stats(self) -> dict[str, dict[str, int]]:
+        return {
+            address: {"hits": self.hits[address], "misses": self.misses[address]}
+            for address in sorted(self.hits.keys() | self.misses.keys())
+        }
+
+    def __store_session(self, address: str, ssl_conn: "SSL.Connection"):
+        session = ssl_conn.get_session()
+        if session is not None:
+            self.__sessions[address] = session
@@ -0,0 +1,88 @@
+from escpr2_tools.constants import EPS_MTID_PLAIN
+from escpr2_tools.escpr_commands import (
+    EscprCommandDSnd,
+    EscprCommandJSetj,
+    EscprCommandPEndp,
+    EscprCommandPSetn,
+    EscprCommandPSttp,
+    EscprCommandQSeti,
+    EscprCommandQSetq,
+)
+from escpr2_tools.ipp import (
+    IPP_OPERATION_SEND_DOCUMENT,
+    IPP_TAG_CHARSET,
+    IPP_TAG_OPERATION_ATTRIBUTES,
+    IPP_VERSION_2_0,
+    IppAttribute,
+    IppAttributeGroup,
+    encode_ipp_message,
+)
+
+ESCPR_START: bytes = b"\x1b(R\x06\x00\x00ESCPR"
+JOB_END: bytes = b"\x1bj\x00\x00\x00\x00endj"
+
+# A4 at 360 dpi
+PAPER_WIDTH: int = 2976
+PAPER_LENGTH: int = 4209
+
+
+def make_send_document_header(
+    operation_id: int = IPP_OPERATION_SEND_DOCUMENT,
+) -> bytes:
+    return encode_ipp_message(
+        IPP_VERSION_2_0,
+        operation_id,
+        1,
+        [
+            IppAttributeGroup(
+                IPP_TAG_OPERATION_ATTRIBUTES,
+                [IppAttribute("attributes-charset", IPP_TAG_CHARSET, [b"utf-8"])],
+            )
+        ],
+    )
+
+
+def make_job(
+    pages: list[list[bytes]],
+    compress_mode: int | None = None,
+    media_type_id: int = EPS_MTID_PLAIN,
+    color_plane: int = 3,
+    page_numbers: bool = False,
+    ipp: bool = False,
+) -> bytes:
+    # One data command per raster of a page, PositionY is the index of the
+    # raster within the page. q-seti is only sent with a compress_mode,
+    # page_numbers adds p-setn before and p-endp after every page.
+    q_setq = EscprCommandQSetq()
+    q_setq.MediaTypeID = media_type_id
+    q_setq.ColorPlane = color_plane
+
+    j_setj = EscprCommandJSetj()
+    j_setj.PaperWidth = PAPER_WIDTH
+    j_setj.PaperLength = PAPER_LENGTH
+
+    b = make_send_document_header() if ipp else bytes()
+    b += ESCPR_START + q_setq.__bytes__()
+    if compress_mode is not None:
+        q_seti = EscprCommandQSeti()
+        q_seti.CompressMode = compress_mode
+        b += q_seti.__bytes__()
+    b += j_setj.__bytes__()
+
+    for page_number, page in enumerate(pages):
+        if page_numbers:
+            p_setn = EscprCommandPSetn()
+            p_setn.NextPage = page_number + 1
+            b += p_setn.__bytes__()
+        b += EscprCommandPSttp().__bytes__()
+        for position_y, raster in enumerate(page):
+            d_snd = EscprCommandDSnd()
+            d_snd.CompressMode = compress_mode or 0
+            d_snd.PositionY = position_y
+            d_snd.DataSize = len(raster)
+            b += d_snd.get_data_command(raster)
+        if page_numbers:
+            p_endp = EscprCommandPEndp()
+            p_endp.NextPage = int(page_number < len(pages) - 1)
+            b += p_endp.__bytes__()
+    return b + JOB_END
@@ -0,0 +1,34 @@
+from pathlib import Path
+
+from benchmarks.load import run_load
+from benchmarks.run import run_benchmarks
+from benchmarks.synthetic import make_send_document
+from escpr2_tools.config import CachedConfig
+from escpr2_tools.proxy import SendDocumentStream
+
+
+def test_run_benchmarks():
+    # Keeps the benchmark in step with the proxy addon interface
+    results = run_benchmarks(pages=1, raster_size=4096, esc_density=1 / 256, repeat=1)
+    assert set(results) == {
+        "get_commands_dict",
+        "print_single",
+        "diff_two",
+        "command_construct_serialise",
+        "modify_send_document_request",
+        "send_document_stream",
+    }
+    for result in results.values():
+        assert result["seconds"] >= 0
+
+
+def test_load_streamed_split_ipp_header():
+    # Through mitmproxy, which must not end the chunked body at the printer
+    # while the proxy holds back the IPP attributes
+    stream = SendDocumentStream(CachedConfig(Path("does-not-exist.toml")))
+    body = make_send_document(pages=1, raster_size=100_000)
+    expected = sum(len(chunk) for data in (body, b"") for chunk in stream(data))
+
+    results = run_load(1, 2, 1, 100_000, ["--stream"], split_ipp_header=True)
+    assert results["jobs"] == 2
+    assert results["printer_received_bodies"] == [expected, expected]
@@ -0,0 +1,115 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from escpr2_tools.capture import CaptureArchive, CaptureWriter, get_job_media
+from escpr2_tools.constants import EPS_MSID_A4, EPS_MTID_PLAIN
+from tests.conftest import ESCPR_START, make_job
+
+
+RASTER = bytes(range(256)) * 8
+
+
+def test_get_job_media():
+    assert get_job_media(make_job([[]])) == (EPS_MSID_A4, EPS_MTID_PLAIN)
+    assert get_job_media(ESCPR_START) == (None, None)
+
+
+def test_capture_archive(tmp_path):
+    original = make_job([[RASTER, RASTER[::-1], b"\x1b" * 16]])
+    rewritten = original.replace(b"\x1b" * 16, b"\x1b" * 8)
+
+    archive = CaptureArchive(tmp_path / "capture.sqlite3", "lzma")
+    job_id = archive.add_job("printer", original, rewritten, 100.0)
+    assert archive.read_stream(job_id) == original
+    assert archive.read_stream(job_id, "rewritten") == rewritten
+    stored_size = archive.get_stored_size()
+    assert stored_size < len(original)
+
+    # Identical raster blocks are stored once
+    second_id = archive.add_job("other", original, None, 200.0)
+    assert archive.get_stored_size() - stored_size < len(RASTER) // 4
+    assert archive.read_stream(second_id) == original
+    with pytest.raises(KeyError):
+        archive.read_stream(second_id, "rewritten")
+    archive.close()
+
+    archive = CaptureArchive(tmp_path / "capture.sqlite3")
+    assert [job.id for job in archive.find_jobs()] == [job_id, second_id]
+    (job,) = archive.find_jobs(printer="printer")
+    assert job.paper_size_id == EPS_MSID_A4
+    assert job.original_size == len(original)
+    assert job.rewritten_size == len(rewritten)
+    assert [job.id for job in archive.find_jobs(since=150.0)] == [second_id]
+    assert archive.find_jobs(media_type_id=EPS_MTID_PLAIN + 1, until=150.0) == []
+    # Blocks keep the codec they were written with
+    assert archive.read_stream(job_id) == original
+    archive.close()
+
+
+def test_capture_writer(tmp_path):
+    original = make_job([[RASTER] * 3])
+    rewritten = make_job([[RASTER] * 3], media_type_id=EPS_MTID_PLAIN + 1)
+
+    writer = CaptureWriter(tmp_path / "capture.sqlite3")
+    writer.capture("buffered", memoryview(original), memoryview(rewritten))
+    stream = writer.capture_stream("streamed")
+    for i in range(0, len(original), 1000):
+        stream.original(original[i : i + 1000])
+    stream.rewritten(rewritten)
+    stream.original(b"")
+    stream.rewritten(b"")
+    writer.capture_stream("incomplete").original(original)
+    writer.close()
+    assert writer.dropped == 0
+
+    archive = CaptureArchive(tmp_path / "capture.sqlite3")
+    jobs = archive.find_jobs()
+    assert [job.printer for job in jobs] == ["buffered", "streamed"]
+    for job in jobs:
+        assert archive.read_stream(job.id) == original
+        assert archive.read_stream(job.id, "rewritten") == rewritten
+    archive.close()
+
+
+def test_capture_writer_survives_failed_jobs(tmp_path, monkeypatch, capsys):
+    job = make_job([[RASTER]])
+
+    def fail(self, raster):
+        raise sqlite3.OperationalError("database or disk is full")
+
+    writer = CaptureWriter(tmp_path / "capture.sqlite3")
+    with monkeypatch.context() as patch:
+        patch.setattr(CaptureArchive, "_CaptureArchive__add_block", fail)
+        stream = writer.capture_stream("failing")
+        stream.original(job)
+        stream.rewritten(job)
+        stream.original(b"")
+        stream.rewritten(b"")
+        # Wait until the streamed job has been written
+        while writer.get_queued_bytes():
+            time.sleep(0.01)
+    writer.capture("working", job, None)
+    writer.close()
+    assert "disk is full" in capsys.readouterr().out
+
+    archive = CaptureArchive(tmp_path / "capture.sqlite3")
+    assert [job.printer for job in archive.find_jobs()] == ["working"]
+    archive.close()
+
+
+def test_capture_writer_queued_bytes(tmp_path):
+    job = make_job([[RASTER]])
+    writer = CaptureWriter(tmp_path / "capture.sqlite3", max_queued_bytes=len(job))
+    blocked = threading.Event()
+    assert writer.put(lambda archive: blocked.wait(), 0)
+    # A job larger than the limit is only accepted with nothing else queued
+    writer.capture("first", job, job)
+    writer.capture("second", job, None)
+    assert writer.dropped == 1
+    assert writer.get_queued_bytes() == 2 * len(job)
+    blocked.set()
+    writer.close()
+    assert writer.get_queued_bytes() == 0
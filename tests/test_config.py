@@ -0,0 +1,68 @@
+from pathlib import Path
+
+from escpr2_tools.config import (
+    CachedConfig,
+    Config,
+    PrintMode,
+    PrinterConfig,
+    load_printer_table,
+)
+
+
+def test_cached_config_reloads_on_change(tmp_path: Path):
+    config_path = tmp_path / "config.toml"
+    cached_config = CachedConfig(config_path)
+    assert cached_config.get_print_mode() == PrintMode.Auto
+
+    config = Config(config_path)
+    config.set_print_mode(PrintMode.CmOff)
+    config.save_config()
+    assert cached_config.get_print_mode() == PrintMode.CmOff
+    assert cached_config.version == 1
+
+    assert not cached_config.reload_if_changed()
+
+    config.set_print_mode(PrintMode.ABW)
+    config.save_config()
+    assert cached_config.get_print_mode() == PrintMode.ABW
+    assert cached_config.version == 2
+
+
+def test_load_printer_table(tmp_path: Path):
+    table_path = tmp_path / "printers.toml"
+    table_path.write_text(
+        "[[printer]]\n"
+        'address = "192.168.1.10"\n'
+        'listen = "192.168.1.2"\n'
+        'config = "office.toml"\n'
+        "[[printer]]\n"
+        'address = "192.168.1.11:8631"\n'
+        'listen = "0.0.0.0:10631"\n'
+        'config = "/etc/escpr2/photo.toml"\n'
+    )
+
+    assert load_printer_table(table_path) == [
+        PrinterConfig("192.168.1.10", "192.168.1.2", tmp_path / "office.toml"),
+        PrinterConfig(
+            "192.168.1.11:8631", "0.0.0.0:10631", Path("/etc/escpr2/photo.toml")
+        ),
+    ]
+
+
+def test_cached_config_keeps_mode_of_invalid_file(tmp_path: Path):
+    config_path = tmp_path / "config.toml"
+    config_path.write_text('print_mode = "CmOff"\n')
+    cached_config = CachedConfig(config_path)
+    assert cached_config.get_print_mode() == PrintMode.CmOff
+
+    for invalid in (
+        'print_mode = "Cm',
+        'print_mode = "Unknown"\n',
+        "print_mode = [1]\n",
+    ):
+        config_path.write_text(invalid)
+        assert cached_config.get_print_mode() == PrintMode.CmOff
+
+    config_path.write_text('print_mode = "ABW"\n')
+    assert cached_config.get_print_mode() == PrintMode.ABW
+    assert cached_config.version == 2
@@ -0,0 +1,191 @@
+import io
+import json
+import threading
+
+from escpr2_tools import decode_escpr
+from escpr2_tools.decode_escpr import (
+    DumpMode,
+    JobDumper,
+    decode_batch,
+    decode_job,
+    diff_files,
+    expand_paths,
+    iter_data_blocks,
+)
+from escpr2_tools.escpr_commands import (
+    EscprCommandJSetj,
+    EscprCommandPEndp,
+    EscprCommandPSetn,
+    EscprCommandPSetq,
+    EscprCommandPSttp,
+    EscprCommandQSetq,
+)
+from tests.conftest import make_job
+
+
+# Raster data that looks like ESC commands
+RASTER = b"\x1b" * 32
+
+
+def test_decode_job_pages():
+    file_bytes = make_job([[RASTER]] * 3, page_numbers=True)
+    job = decode_job(file_bytes)
+
+    assert len(job.pages) == 3
+    assert len(job.commands) == 2 + 3 * 3 + 1
+    assert [type(cmd.command) for cmd in job.get_header_commands()] == [
+        EscprCommandQSetq,
+        EscprCommandJSetj,
+        EscprCommandPSetn,
+    ]
+
+    p_setn_header = EscprCommandPSetn.get_command_header()
+    assert [cmd.command.NextPage for cmd in job.find(p_setn_header)] == [1, 2, 3]
+    p_sttp = EscprCommandPSttp().__bytes__()
+    p_endp_header = EscprCommandPEndp.get_command_header()
+    for page_number, page in enumerate(job.pages):
+        (p_endp,) = job.find(p_endp_header, page=page_number)
+        assert p_endp.command.NextPage == int(page_number < 2)
+        assert file_bytes[p_endp.offset] == 0x1B
+        assert file_bytes[page.offset : page.end].startswith(p_sttp)
+
+
+def test_job_dumper(capsys):
+    file_bytes = make_job([[RASTER]] * 2, page_numbers=True)
+
+    JobDumper(DumpMode.Off).dump("Off", file_bytes)
+    assert capsys.readouterr().out == ""
+
+    JobDumper(DumpMode.Sync).dump("Sync", file_bytes)
+    sync_out = capsys.readouterr().out
+
+    dumper = JobDumper(DumpMode.Background)
+    dumper.dump("Sync", file_bytes)
+    dumper.close()
+    assert capsys.readouterr().out == sync_out
+    assert "Page 1:" in sync_out
+
+
+def test_job_dumper_stream(capsys):
+    file_bytes = make_job([[RASTER]] * 3, page_numbers=True)
+    JobDumper(DumpMode.Sync).dump("Job", file_bytes)
+    expected = capsys.readouterr().out
+
+    for mode in (DumpMode.Sync, DumpMode.Background):
+        dumper = JobDumper(mode)
+        feed = dumper.dump_stream("Job")
+        for i in range(0, len(file_bytes), 5):
+            feed(file_bytes[i : i + 5])
+        feed(b"")
+        dumper.close()
+        assert capsys.readouterr().out == expected
+
+
+def test_diff_files(tmp_path):
+    ref_path = tmp_path / "ref.prn"
+    ref_path.write_bytes(make_job([[RASTER]] * 2, page_numbers=True))
+
+    p_setq = EscprCommandPSetq()
+    p_setq.LUT = 0x04
+    job = make_job([[RASTER]] * 2, page_numbers=True)
+    p_sttp = EscprCommandPSttp().__bytes__()
+    position = job.index(p_sttp) + len(p_sttp)
+    job = job[:position] + p_setq.__bytes__() + job[position:]
+    job = job.replace(
+        b"\x1bp\x01\x00\x00\x00setn\x02", b"\x1bp\x01\x00\x00\x00setn\x05"
+    )
+    path = tmp_path / "other.prn"
+    path.write_bytes(job)
+
+    out = io.StringIO()
+    diff_files(str(ref_path), str(path), out)
+    differences = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert [difference["change"] for difference in differences] == [
+        "added",
+        "changed",
+    ]
+    assert differences[0]["offset"] == position
+    assert differences[0]["parameters"]["LUT"] == 0x04
+    assert differences[1]["ref_parameters"] == {"NextPage": 2}
+    assert differences[1]["parameters"] == {"NextPage": 5}
+
+
+def test_decode_batch(tmp_path):
+    (tmp_path / "jobs").mkdir()
+    for pages in range(1, 4):
+        (tmp_path / "jobs" / f"{pages}.prn").write_bytes(
+            make_job([[RASTER]] * pages, page_numbers=True)
+        )
+
+    paths = expand_paths([str(tmp_path / "jobs"), str(tmp_path / "missing.prn")])
+    assert len(paths) == 4
+
+    for jobs in (1, 2):
+        out = io.StringIO()
+        decode_batch(paths, out, jobs)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+
+        assert [len(record.get("pages", [])) for record in records] == [1, 2, 3, 0]
+        assert records[0]["size"] == len(make_job([[RASTER]], page_numbers=True))
+        assert records[0]["commands"][0]["command"] == "q-setq (PrintQuality)"
+        assert "error" in records[3]
+
+
+def test_data_blocks():
+    raster = b"\x1b" * 64
+    file_bytes = make_job([[raster, raster]] * 2, compress_mode=1)
+
+    job = decode_job(file_bytes)
+    assert len(job.data_blocks) == 4
+    assert list(iter_data_blocks(file_bytes)) == job.data_blocks
+    for page_number in range(2):
+        data_blocks = job.get_page_data_blocks(page_number)
+        assert [data_block.parameters.PositionY for data_block in data_blocks] == [
+            0,
+            1,
+        ]
+        for data_block in data_blocks:
+            assert data_block.compress_mode == 1
+            assert (
+                file_bytes[
+                    data_block.raster_offset : data_block.raster_offset
+                    + data_block.raster_length
+                ]
+                == raster
+            )
+
+
+def test_job_dumper_survives_failed_jobs(monkeypatch, capsys):
+    print_titled_job = decode_escpr.print_titled_job
+    calls = 0
+
+    def print_once(title, job):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise BrokenPipeError("stdout closed")
+        print_titled_job(title, job)
+
+    monkeypatch.setattr(decode_escpr, "print_titled_job", print_once)
+    dumper = JobDumper(DumpMode.Background)
+    dumper.dump("Broken", make_job([[RASTER]], page_numbers=True))
+    dumper.dump("Job", make_job([[RASTER]], page_numbers=True))
+    dumper.close()
+    captured = capsys.readouterr()
+    assert "Could not dump job: BrokenPipeError" in captured.err
+    assert "Job\n" in captured.out and "Broken" not in captured.out
+
+
+def test_job_dumper_close_does_not_block(monkeypatch):
+    blocked = threading.Event()
+    monkeypatch.setattr(
+        decode_escpr, "print_titled_job", lambda title, job: blocked.wait()
+    )
+    dumper = JobDumper(DumpMode.Background)
+    dumper.dump("Blocking", make_job([[RASTER]], page_numbers=True))
+    feed = dumper.dump_stream("Stream")
+    while not dumper.dropped:
+        feed(b"\x1b@")
+    dumper.close(timeout=0.01)
+    blocked.set()
@@ -1,4 +1,11 @@
-from escpr2_tools.escpr_commands import COMMANDS, EscprCommandJSetj, EscprCommandPSetn
+import pytest
+
+from escpr2_tools.escpr_commands import (
+    COMMANDS,
+    EscprCommand,
+    EscprCommandJSetj,
+    EscprCommandPSetn,
+)
 
 
 def test_check_parameter_defs():
@@ -7,6 +14,15 @@ def test_check_parameter_defs():
         cmd.check_parameter_defs()
 
 
+def test_parameter_defs_checked_at_class_creation():
+    with pytest.raises(ValueError):
+
+        class EscprCommandInvalid(EscprCommand):
+            PARAMETER_LENGTH: int = 3
+
+            PARAMETER_DEFS: list[str | tuple[str, str]] = [("Value", ">I")]
+
+
 def test_j_setj():
     data = bytes(
         [
@@ -55,7 +71,37 @@ def test_p_setn():
     print(cmd.__str__())
     assert cmd.NextPage == 1
 
+
 def test_p_setn_empty():
     cmd = EscprCommandPSetn()
     print(cmd.__str__())
     assert cmd.NextPage == 0
+
+
+def test_zero_copy_parameters():
+    buf = bytearray(b"\x00\x01\x02")
+    cmd = EscprCommandPSetn(memoryview(buf)[1:2])
+    assert not hasattr(cmd, "__dict__")
+    assert cmd.NextPage == 1
+
+    cmd.detach()
+    buf[1] = 0x05
+    assert cmd.NextPage == 1
+    assert cmd.raw_parameters == b"\x01"
+
+
+def test_set_parameter():
+    cmd = EscprCommandPSetn(b"\x01")
+    cmd.NextPage = 2
+    assert cmd.raw_parameters == b"\x02"
+    assert cmd == EscprCommandPSetn(b"\x02")
+    assert cmd.__bytes__() == b"\x1bp\x01\x00\x00\x00setn\x02"
+
+
+def test_precomputed_headers():
+    assert EscprCommandPSetn.COMMAND_HEADER == b"p\x01\x00\x00\x00setn"
+    assert (
+        EscprCommandPSetn.get_esc_command_header()
+        is EscprCommandPSetn.ESC_COMMAND_HEADER
+    )
+    assert EscprCommandJSetj.ESC_COMMAND_HEADER == b"\x1bj\x16\x00\x00\x00setj"
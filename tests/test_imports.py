@@ -0,0 +1,29 @@
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "escpr2_tools.decode_escpr",
+        "escpr2_tools.config",
+        "escpr2_tools.capture",
+        "escpr2_tools.proxy",
+    ],
+)
+def test_cli_modules_do_not_import_mitmproxy(module):
+    # mitmproxy is only imported once the proxy is started
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, {module}; "
+            "print(sorted({'mitmproxy', 'unittest'} & set(sys.modules)))",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,50 @@
+from escpr2_tools.ipp import (
+    IPP_OPERATION_SEND_DOCUMENT,
+    IPP_TAG_CHARSET,
+    IPP_TAG_KEYWORD,
+    IPP_TAG_OPERATION_ATTRIBUTES,
+    IPP_VERSION_2_0,
+    IppAttribute,
+    IppAttributeGroup,
+    encode_ipp_message,
+    parse_ipp_message,
+)
+
+ATTRIBUTE_GROUPS = [
+    IppAttributeGroup(
+        IPP_TAG_OPERATION_ATTRIBUTES,
+        [
+            IppAttribute("attributes-charset", IPP_TAG_CHARSET, [b"utf-8"]),
+            IppAttribute(
+                "requested-attributes", IPP_TAG_KEYWORD, [b"all", b"media-col"]
+            ),
+        ],
+    )
+]
+
+
+def test_parse_ipp_message():
+    header = encode_ipp_message(
+        IPP_VERSION_2_0, IPP_OPERATION_SEND_DOCUMENT, 42, ATTRIBUTE_GROUPS
+    )
+    # Document data that happens to look like a Send-Document
+    document = bytes([0x02, 0x00, 0x00, 0x06]) * 4
+
+    message = parse_ipp_message(header + document)
+    assert message is not None
+    assert message.version == IPP_VERSION_2_0
+    assert message.operation_id == IPP_OPERATION_SEND_DOCUMENT
+    assert message.request_id == 42
+    assert message.attribute_groups == ATTRIBUTE_GROUPS
+    assert message.document_offset == len(header)
+
+    attribute = message.find_attribute("requested-attributes")
+    assert attribute is not None and attribute.values == [b"all", b"media-col"]
+
+
+def test_parse_ipp_message_incomplete():
+    header = encode_ipp_message(
+        IPP_VERSION_2_0, IPP_OPERATION_SEND_DOCUMENT, 1, ATTRIBUTE_GROUPS
+    )
+    for length in range(len(header)):
+        assert parse_ipp_message(header[:length]) is None
@@ -0,0 +1,105 @@
+from mitmproxy.test import tflow, tutils
+
+from escpr2_tools.ipp import (
+    IPP_OPERATION_CANCEL_JOB,
+    IPP_OPERATION_GET_PRINTER_ATTRIBUTES,
+    IPP_TAG_CHARSET,
+    IPP_TAG_KEYWORD,
+    IPP_TAG_OPERATION_ATTRIBUTES,
+    IPP_VERSION_2_0,
+    IppAttribute,
+    IppAttributeGroup,
+    encode_ipp_message,
+)
+from escpr2_tools.ipp_cache import ATTRIBUTE_CACHE, PrinterAttributeCache
+
+
+def make_request(operation_id: int, request_id: int) -> bytes:
+    return encode_ipp_message(
+        IPP_VERSION_2_0,
+        operation_id,
+        request_id,
+        [
+            IppAttributeGroup(
+                IPP_TAG_OPERATION_ATTRIBUTES,
+                [
+                    IppAttribute("attributes-charset", IPP_TAG_CHARSET, [b"utf-8"]),
+                    IppAttribute(
+                        "requested-attributes", IPP_TAG_KEYWORD, [b"printer-state"]
+                    ),
+                ],
+            )
+        ],
+    )
+
+
+def make_flow(operation_id: int, request_id: int):
+    flow = tflow.tflow(
+        req=tutils.treq(
+            method=b"POST",
+            path=b"/ipp/print",
+            content=make_request(operation_id, request_id),
+        )
+    )
+    flow.request.stream = False
+    return flow
+
+
+def send(cache: PrinterAttributeCache, flow, status_code: int = 0) -> bytes:
+    cache.request(flow)
+    if flow.response is None:
+        # Answer from the printer
+        flow.response = tutils.tresp(
+            content=encode_ipp_message(
+                IPP_VERSION_2_0,
+                status_code,
+                int.from_bytes(flow.request.content[4:8], "big"),
+                [],
+            )
+        )
+        cache.response(flow)
+    return flow.response.content
+
+
+def test_printer_attribute_cache():
+    now = 0.0
+    cache = PrinterAttributeCache(5.0, clock=lambda: now)
+    hits, misses = ATTRIBUTE_CACHE.get(result="hit"), ATTRIBUTE_CACHE.get(result="miss")
+
+    first = send(cache, make_flow(IPP_OPERATION_GET_PRINTER_ATTRIBUTES, 1))
+    second = send(cache, make_flow(IPP_OPERATION_GET_PRINTER_ATTRIBUTES, 2))
+    assert (cache.hits, cache.misses) == (1, 1)
+    # Same response with the request-id of the request
+    assert second == first[:4] + (2).to_bytes(4, "big") + first[8:]
+
+    now = 10.0
+    send(cache, make_flow(IPP_OPERATION_GET_PRINTER_ATTRIBUTES, 3))
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    send(cache, make_flow(IPP_OPERATION_CANCEL_JOB, 4))
+    send(cache, make_flow(IPP_OPERATION_GET_PRINTER_ATTRIBUTES, 5))
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert ATTRIBUTE_CACHE.get(result="hit") == hits + 1
+    assert ATTRIBUTE_CACHE.get(result="miss") == misses + 3
+
+
+def test_printer_attribute_cache_errors():
+    cache = PrinterAttributeCache(5.0, clock=lambda: 0.0)
+
+    # client-error-not-found
+    send(cache, make_flow(IPP_OPERATION_GET_PRINTER_ATTRIBUTES, 1), 0x0406)
+    send(cache, make_flow(IPP_OPERATION_GET_PRINTER_ATTRIBUTES, 2))
+    assert cache.misses == 2
+
+
+def test_printer_attribute_cache_invalidated_while_forwarded():
+    cache = PrinterAttributeCache(5.0, clock=lambda: 0.0)
+
+    flow = make_flow(IPP_OPERATION_GET_PRINTER_ATTRIBUTES, 1)
+    cache.request(flow)
+    cache.invalidate(flow)
+    flow.response = tutils.tresp(content=encode_ipp_message(IPP_VERSION_2_0, 0, 1, []))
+    cache.response(flow)
+
+    send(cache, make_flow(IPP_OPERATION_GET_PRINTER_ATTRIBUTES, 2))
+    assert (cache.hits, cache.misses) == (0, 2)
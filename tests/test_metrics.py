@@ -0,0 +1,44 @@
+import urllib.request
+
+from escpr2_tools.metrics import MetricsRegistry
+
+
+def test_render():
+    registry = MetricsRegistry()
+    jobs = registry.counter("jobs_total", "Jobs", ("outcome",))
+    stage = registry.histogram("stage_seconds", "Stages", ("stage",), (0.1, 1.0))
+
+    jobs.inc(outcome="rewritten")
+    jobs.inc(2, outcome='say "hi"')
+    stage.observe(0.05, stage="rewrite")
+    stage.observe(0.5, stage="rewrite")
+    stage.observe(5, stage="rewrite")
+
+    assert jobs.get(outcome="rewritten") == 1
+    assert stage.get_count(stage="rewrite") == 3
+    assert registry.render() == (
+        "# HELP jobs_total Jobs\n"
+        "# TYPE jobs_total counter\n"
+        'jobs_total{outcome="rewritten"} 1\n'
+        'jobs_total{outcome="say \\"hi\\""} 2\n'
+        "# HELP stage_seconds Stages\n"
+        "# TYPE stage_seconds histogram\n"
+        'stage_seconds_bucket{stage="rewrite",le="0.1"} 1\n'
+        'stage_seconds_bucket{stage="rewrite",le="1.0"} 2\n'
+        'stage_seconds_bucket{stage="rewrite",le="+Inf"} 3\n'
+        'stage_seconds_sum{stage="rewrite"} 5.55\n'
+        'stage_seconds_count{stage="rewrite"} 3\n'
+    )
+
+
+def test_server():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests").inc()
+    registry.start_server("127.0.0.1", 0)
+    try:
+        host, port = registry.get_server_address()
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert b"requests_total 1\n" in response.read()
+    finally:
+        registry.stop_server()
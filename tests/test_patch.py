@@ -0,0 +1,56 @@
+import pytest
+
+from escpr2_tools.patch import PatchPlan
+
+
+def test_patch_plan():
+    source = b"0123456789"
+    plan = PatchPlan()
+    plan.insert(10, b"end")
+    plan.delete(2, 3)
+    plan.insert(0, b"a")
+    plan.insert(0, b"b")
+    plan.replace(7, 1, b"seven")
+
+    expected = b"ab01" + b"56" + b"seven" + b"89" + b"end"
+    assert plan.apply(source) == expected
+    assert plan.get_size(len(source)) == len(expected)
+    assert b"".join(plan.iter_slices(memoryview(source))) == expected
+    assert plan.moved(2).apply(b"xx" + source) == b"xx" + expected
+
+
+def test_patch_plan_slices_are_views():
+    source = bytearray(b"0123456789")
+    plan = PatchPlan()
+    plan.insert(5, b"-")
+
+    first, inserted, last = plan.iter_slices(source)
+    source[0] = ord("x")
+    assert bytes(first) == b"x1234"
+    assert inserted == b"-"
+    assert bytes(last) == b"56789"
+    first.release()
+    last.release()
+
+
+def test_patch_plan_invalid_edits():
+    plan = PatchPlan()
+    plan.delete(2, 4)
+    plan.insert(3, b"x")
+    with pytest.raises(ValueError):
+        plan.apply(b"0123456789")
+
+    plan = PatchPlan()
+    plan.delete(8, 4)
+    with pytest.raises(ValueError):
+        plan.apply(b"0123456789")
+
+
+def test_patch_plan_extend():
+    plan = PatchPlan()
+    plan.insert(2, b"ab")
+    other = PatchPlan()
+    other.delete(4, 2)
+    plan.extend(other)
+    assert len(plan) == 2 and len(other) == 1
+    assert plan.apply(b"0123456789") == b"01ab236789"
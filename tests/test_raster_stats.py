@@ -0,0 +1,47 @@
+import pytest
+
+from tests.conftest import make_job
+
+np = pytest.importorskip("numpy")
+
+from escpr2_tools.raster_stats import decode_run_length, get_raster_statistics
+
+
+def test_decode_run_length():
+    # 2 literal pixels, then 1 pixel repeated 3 times
+    raster = b"\x01" + b"\x1b\x00\x00" + b"\x00\x1b\x00" + b"\xfe" + b"\xff\x80\x00"
+    pixels = decode_run_length(np.frombuffer(raster, dtype=np.uint8), 3)
+
+    assert pixels.tolist() == [
+        [0x1B, 0x00, 0x00],
+        [0x00, 0x1B, 0x00],
+        [0xFF, 0x80, 0x00],
+        [0xFF, 0x80, 0x00],
+        [0xFF, 0x80, 0x00],
+    ]
+
+
+def test_raster_statistics_run_length():
+    white_band = b"\xf9\xff\xff\xff"
+    cyan_band = b"\xfd\x00\xff\xff"
+    stats = get_raster_statistics(make_job([[white_band, cyan_band], []], 1))
+
+    assert stats.bytes_per_pixel == 3
+    first, second = stats.pages
+    assert first.data_blocks == 2
+    assert first.compressed_bytes == 8
+    assert first.raster_bytes == 8 * 3 + 4 * 3
+    assert first.compression_ratio == 36 / 8
+    assert first.blank_blocks == 1
+    assert first.ink_coverage == {"C": 4 / 12, "M": 0.0, "Y": 0.0}
+    assert second.data_blocks == 0
+    assert second.ink_coverage == {"C": 0.0, "M": 0.0, "Y": 0.0}
+
+
+def test_raster_statistics_uncompressed():
+    stats = get_raster_statistics(make_job([[b"\x00\x00\x00\xff\xff\xff"]], 0))
+
+    (page,) = stats.pages
+    assert page.compression_ratio == 1.0
+    assert page.blank_blocks == 0
+    assert page.ink_coverage == {"C": 0.5, "M": 0.5, "Y": 0.5}
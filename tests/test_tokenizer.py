@@ -0,0 +1,93 @@
+from escpr2_tools.decode_escpr import get_commands_dict
+from escpr2_tools.escpr_commands import (
+    EscprCommandDSnd,
+    EscprCommandJSetj,
+    EscprCommandPEndp,
+    EscprCommandPSetn,
+    EscprCommandPSttp,
+    EscprCommandQSetq,
+)
+from escpr2_tools.tokenizer import EscprTokenizer, index_commands, tokenize
+from tests.conftest import make_job
+
+
+# An EJL preamble, raster data holding a fake p-setn and a trailing reset
+JOB = (
+    b"\x1b\x01@EJL 1284.4\n@EJL     \n"
+    + make_job(
+        [[b"\x1bp\x01\x00\x00\x00setn\x07" * 20, b"\x1b" * 100]], page_numbers=True
+    )
+    + b"\x1b@"
+)
+
+
+def test_tokenize():
+    job = JOB
+    tokens = list(tokenize(job))
+
+    assert [token.header for token in tokens] == [
+        b"(R",
+        EscprCommandQSetq.get_command_header(),
+        EscprCommandJSetj.get_command_header(),
+        EscprCommandPSetn.get_command_header(),
+        EscprCommandPSttp.get_command_header(),
+        EscprCommandDSnd.get_esc_data_header(220)[1:],
+        EscprCommandDSnd.get_esc_data_header(100)[1:],
+        EscprCommandPEndp.get_command_header(),
+        b"j\x00\x00\x00\x00endj",
+    ]
+    assert tokens[0].params == b"\x00ESCPR"
+    # PositionY 0, CompressMode 0 and DataSize 220 of the first raster
+    assert tokens[5].is_data and tokens[5].params == b"\x00\x00\x00\x00\x00\x00\xdc"
+    assert job[tokens[8].offset] == 0x1B
+    assert tokens[8].end == len(job) - 2
+
+
+def test_tokenize_incremental():
+    job = JOB
+    expected = list(tokenize(job))
+
+    for chunk_size in (1, 3, 11, 64):
+        tokenizer = EscprTokenizer()
+        tokens = []
+        for i in range(0, len(job), chunk_size):
+            tokens.extend(tokenizer.feed(memoryview(job)[i : i + chunk_size]))
+        tokenizer.close()
+        assert tokens == expected
+
+
+def test_get_commands_dict_skips_data():
+    commands_dict = get_commands_dict(JOB)
+
+    assert list(commands_dict.keys()) == [
+        EscprCommandQSetq.get_command_header(),
+        EscprCommandJSetj.get_command_header(),
+        EscprCommandPSetn.get_command_header(),
+        EscprCommandPSttp.get_command_header(),
+        EscprCommandPEndp.get_command_header(),
+        b"j\x00\x00\x00\x00endj",
+    ]
+    p_setn = commands_dict[EscprCommandPSetn.get_command_header()]
+    assert isinstance(p_setn, EscprCommandPSetn)
+    assert p_setn.NextPage == 1
+
+
+def test_index_commands():
+    job = JOB
+    j_setj_header = EscprCommandJSetj.get_command_header()
+    p_setn_header = EscprCommandPSetn.get_command_header()
+
+    index = index_commands(job, [j_setj_header, p_setn_header])
+    assert [token.offset for token in index[j_setj_header]] == [
+        job.index(EscprCommandJSetj.get_esc_command_header())
+    ]
+    # The p-setn inside the raster data is not found
+    assert [token.offset for token in index[p_setn_header]] == [
+        job.index(b"\x1bp\x01\x00\x00\x00setn\x01")
+    ]
+
+    p_endp_header = EscprCommandPEndp.get_command_header()
+    index = index_commands(
+        job, [p_endp_header], stop=EscprCommandPSttp.get_command_header()
+    )
+    assert index == {p_endp_header: []}
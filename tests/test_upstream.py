@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import escpr2_tools.upstream
+from escpr2_tools.upstream import TLS_HANDSHAKES, UpstreamTlsSessions, get_address_key
+
+
+class FakeSslConnection:
+    def __init__(self, reused: bool) -> None:
+        self.reused: bool = reused
+        self.session: object | None = None
+
+    def set_session(self, session: object):
+        self.session = session
+
+    def get_session(self) -> object:
+        return self.session if self.session is not None else object()
+
+
+def make_tls_data(ssl_conn: FakeSslConnection, conn_id: str):
+    return SimpleNamespace(
+        conn=SimpleNamespace(id=conn_id, address=("192.168.1.10", 631)),
+        ssl_conn=ssl_conn,
+        is_dtls=False,
+    )
+
+
+def test_get_address_key():
+    assert get_address_key(("192.168.1.10", 631)) == "192.168.1.10:631"
+    assert get_address_key(("fd00::10", 631, 0, 0)) == "[fd00::10]:631"
+
+
+def test_upstream_tls_sessions(monkeypatch):
+    monkeypatch.setattr(
+        escpr2_tools.upstream, "session_reused", lambda ssl_conn: ssl_conn.reused
+    )
+    sessions = UpstreamTlsSessions()
+    printer = "192.168.1.10:631"
+    resumed = TLS_HANDSHAKES.get(printer=printer, result="resumed")
+    full = TLS_HANDSHAKES.get(printer=printer, result="full")
+
+    first = make_tls_data(FakeSslConnection(False), "first")
+    sessions.tls_start_server(first)
+    assert first.ssl_conn.session is None
+    sessions.tls_established_server(first)
+    sessions.server_disconnected(SimpleNamespace(server=first.conn))
+
+    second = make_tls_data(FakeSslConnection(True), "second")
+    sessions.tls_start_server(second)
+    assert second.ssl_conn.session is not None
+    sessions.tls_established_server(second)
+
+    assert sessions.get_stats() == {printer: {"hits": 1, "misses": 1}}
+    assert TLS_HANDSHAKES.get(printer=printer, result="resumed") == resumed + 1
+    assert TLS_HANDSHAKES.get(printer=printer, result="full") == full + 1
+
+    sessions.tls_failed_server(second)
+    third = make_tls_data(FakeSslConnection(False), "third")
+    sessions.tls_start_server(third)
+    assert third.ssl_conn.session is None